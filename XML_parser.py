@@ -1,44 +1,351 @@
 from abc import abstractmethod
+from contextlib import nullcontext
 from sqlalchemy import *
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.automap import automap_base
-from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
+from pipeline_metrics import metrics
+from database import engine_provider, get_engine, get_session
 from datetime import datetime
 
+import xml.etree.ElementTree as ET
+import numpy as np
 import pandas as pd
 import uuid
+import hashlib
+import io
 import os
+import threading
 import traceback
 
+
+def __getattr__(name):
+    """
+    Keeps 'sql_engine' and 'Session' available as module attributes. The engine is created on the first access,
+    importing the module doesn't connect to the database, see 'database.EngineProvider'.
+    """
+    if name == 'sql_engine':
+        return get_engine()
+    if name == 'Session':
+        return engine_provider.get_session_factory()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+"""
+DataFrames with at least this many rows are loaded with COPY instead of INSERT statements.
+"""
+COPY_THRESHOLD = 10000
+
 """
-Load environment variables from the specific .env file.
+Serializes table creation and primary key changes, so loader threads don't create the same table twice.
 """
-load_dotenv(override=True, dotenv_path='.env')
+schema_lock = threading.RLock()
 
 """
-Retrieve database connection settings from environment variables.
+ID strategies: 'random' generates UUIDv4 IDs, 'deterministic' generates UUIDv5 IDs from natural keys in ID_NAMESPACE,
+so the same record gets the same ID in every run and in every worker process.
 """
-DB_HOST = os.getenv('DB_HOST')
-DB_NAME = os.getenv('DB_NAME')
-DB_USER = os.getenv('DB_USER')
-DB_PWD = os.getenv('DB_PWD')
-DB_PORT = os.getenv('DB_PORT')
+ID_STRATEGIES = ('random', 'deterministic')
+ID_NAMESPACE = uuid.UUID('566f5818-8eb4-41de-8681-f7e956b83605')
+id_strategy = 'random'
+
+
+def set_id_strategy(strategy):
+    """
+    Sets the ID strategy of the process. Worker processes must set the same strategy as the main process.
+    :param strategy: One of ID_STRATEGIES.
+    """
+    global id_strategy
+    if strategy not in ID_STRATEGIES:
+        raise ValueError(f"Unknown ID strategy '{strategy}', expected one of {ID_STRATEGIES}")
+    id_strategy = strategy
+
+
+def get_id_strategy():
+    return id_strategy
+
+
+def generate_id(*natural_key):
+    """
+    Generates the ID of a record. The natural key is only used by the 'deterministic' strategy, e.g.
+    ('Project', project_name), (field, value) for lookup rows or (table_name, project_id, position) for records.
+    :param natural_key: The parts of the natural key of the record.
+    :return: A UUID.
+    """
+    if id_strategy == 'deterministic':
+        return uuid.uuid5(ID_NAMESPACE, '\x1f'.join(str(part) for part in natural_key))
+    return uuid.uuid4()
+
+
+class ReflectionRegistry:
+    """
+    A process-wide cache of the reflected database schema.
+
+    The public schema is reflected once and the mapped classes and Table objects are served from the cache until
+    'invalidate' is called. Methods that create or drop tables must invalidate the registry.
+    """
+
+    def __init__(self):
+        self._base = None
+        self._lock = threading.Lock()
+
+    def get_base(self):
+        """
+        Returns the cached automap base class, reflecting the public schema if it is not cached yet.
+        """
+        with self._lock:
+            if self._base is None:
+                Base = automap_base()
+                Base.prepare(autoload_with=get_engine(), schema='public')
+                self._base = Base
+            return self._base
+
+    def get_class(self, table_name):
+        """
+        Returns the mapped class of the given table, or None if the table is not mapped.
+        :param table_name: The name of the table without schema.
+        """
+        return getattr(self.get_base().classes, table_name, None)
+
+    def get_table(self, table_name):
+        """
+        Returns the Table object of the given table, or None if the table doesn't exist.
+        :param table_name: The name of the table without schema.
+        """
+        return self.get_base().metadata.tables.get(f'public.{table_name}')
+
+    def has_table(self, table_name):
+        """
+        Checks whether the given table exists in the reflected schema.
+        :param table_name: The name of the table without schema.
+        """
+        return self.get_table(table_name) is not None
+
+    def invalidate(self):
+        """
+        Drops the cached schema, so it is reflected again on the next access.
+        """
+        with self._lock:
+            self._base = None
+
+
+reflection_registry = ReflectionRegistry()
+
+
+class TableSchemaCache:
+    """
+    A process-wide cache of the column names of the public tables, read with one catalog query.
+
+    It is used by the single-transaction loader instead of inspecting each table on every load. Tables created by
+    that loader are added to the cache, methods that drop tables or create them otherwise must invalidate it.
+    """
+
+    def __init__(self):
+        self._columns = None
+        self._lock = threading.Lock()
+
+    def get_columns(self, table_name):
+        """
+        Returns the column names of the given table in table order, or None if the table doesn't exist.
+        :param table_name: The name of the table without schema.
+        """
+        with self._lock:
+            if self._columns is None:
+                self._columns = {}
+                with get_engine().connect() as conn:
+                    rows = conn.execute(text(
+                        "SELECT table_name, column_name FROM information_schema.columns "
+                        "WHERE table_schema = 'public' ORDER BY table_name, ordinal_position;"))
+                    for name, column_name in rows:
+                        self._columns.setdefault(name, []).append(column_name)
+            return self._columns.get(table_name)
+
+    def add_table(self, table_name, columns):
+        with self._lock:
+            if self._columns is not None:
+                self._columns[table_name] = list(columns)
+
+    def invalidate(self):
+        with self._lock:
+            self._columns = None
+
+
+table_schema_cache = TableSchemaCache()
+
+
+ARRAY_QUOTED_CHARACTERS = frozenset('{}",\\ \t\n\r\v\f')
+
+
+def to_array_literal(values):
+    """
+    Converts a list or tuple to a PostgreSQL array literal, e.g. an empty list is written as '{}'.
+    Items are quoted only when PostgreSQL quotes them in its own array output, so a list written with COPY is stored
+    as the same text as a list inserted as an ARRAY by 'to_sql' or 'insert_rows'.
+    :param values: The list or tuple to convert.
+    :return: The array literal as a string, e.g. '{a,b}'.
+    """
+    items = []
+    for value in values:
+        if value is None:
+            items.append('NULL')
+            continue
+        item = str(value)
+        if not item or item.upper() == 'NULL' or not ARRAY_QUOTED_CHARACTERS.isdisjoint(item):
+            item = '"' + item.replace('\\', '\\\\').replace('"', '\\"') + '"'
+        items.append(item)
+    return '{' + ','.join(items) + '}'
+
 
 """
-Construct the database engine URL and initialize the SQLAlchemy engine.
+Declared schema. The ID columns are stored as native uuid and the columns used in joins and lookups are indexed.
+'Project' and the lookup tables have a fixed set of columns, they are declared completely in DECLARED_TABLES and created
+by 'bootstrap_schema' before loading. The other tables get their XML attributes as columns, they are created from the
+first DataFrame and only their UUID_COLUMNS are typed. The shared field reference columns of 'RenderPass' stay text,
+depending on the XML a cell holds a single ID or an array literal of IDs.
 """
-engine_url = f'postgresql://{DB_USER}:{DB_PWD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
-sql_engine = create_engine(engine_url, pool_size=10, max_overflow=20, pool_timeout=30)
-Session = sessionmaker(bind=sql_engine)
+UUID = postgresql.UUID(as_uuid=False)
+UUID_COLUMNS = {
+    'Project': ['Project_ID'],
+    'ProjectSettings': ['ProjectSettings_ID', 'Project_ID'],
+    'DeadlineSettings': ['DeadlineSettings_ID', 'Project_ID'],
+    'OutputSettings': ['OutputSettings_ID', 'Project_ID'],
+    'ChaosCloudSettings': ['Project_ID'],
+    'JarvisSettings': ['JarvisSettings_ID', 'Project_ID'],
+    'LinkingRecords': ['LinkingRecords_ID', 'Project_ID'],
+    'RenderPass': ['RenderPass_ID', 'BasePass_ID', 'LinkingRecord_ID', 'Project_ID', 'State_ID'],
+    'StateSettings': ['StateSettings_ID', 'Project_ID'],
+    'State': ['State_ID', 'StateSettings_ID', 'Project_id'],
+    'Zone': ['Zone_ID', 'State_ID', 'Project_ID'],
+}
+DECLARED_TABLES = {
+    'Project': {'Project_ID': UUID, 'ProjectName': Text()},
+    'FeatureCodes': {'FeatureCodes_ID': UUID, 'FeatureCodesNames': Text(), 'JarvisFeed_ID': BigInteger(),
+                     'Version': BigInteger(), 'User': Text()},
+    'Lighting': {'Lighting_ID': UUID, 'LightingNames': Text(), 'Scene_ID': Text(), 'Version': BigInteger(),
+                 'User': Text()},
+    'Layers': {'Layers_ID': UUID, 'StateName': Text(), 'State_ID': UUID, 'LayersNames': Text(), 'Scene_ID': Text(),
+               'Version': BigInteger(), 'User': Text()},
+    'Zones': {'Zones_ID': UUID, 'StateName': Text(), 'State_ID': UUID, 'ZonesNames': Text(), 'MaterialNames': Text(),
+              'Assignments': Text(), 'Version': BigInteger(), 'User': Text()},
+    'RenderedScenes': {'RenderedScenes_ID': UUID, 'Department': Text(), 'Scene_ID': Text(), 'Version': BigInteger(),
+                       'User': Text()},
+    'OptionExclude': {'OptionExclude_ID': UUID, 'ExcludeName': Text(), 'Scene_ID': Text(), 'Version': BigInteger(),
+                      'User': Text()},
+    'OptionInclude': {'OptionInclude_ID': UUID, 'IncludeName': Text(), 'Scene_ID': Text(), 'Version': BigInteger(),
+                      'User': Text()},
+}
+TABLE_INDEXES = {
+    'RenderPass': ['BasePass_ID', 'LinkingRecord_ID', 'Project_ID'],
+    'Project': ['ProjectName'],
+    'State': ['Assignments', 'Layers', 'Name'],
+    'FeatureCodes': ['FeatureCodesNames'],
+    'Layers': ['LayersNames'],
+    'Lighting': ['LightingNames'],
+    'Zones': ['ZonesNames'],
+    'RenderedScenes': ['Department'],
+    'OptionExclude': ['ExcludeName'],
+    'OptionInclude': ['IncludeName'],
+}
+
+
+""" Tables both file types load rows to, the 'Type' column of a row is the type of the file it comes from """
+FILE_TYPE_TABLES = ['ProjectSettings']
+
+
+def declared_dtypes(table_name, columns):
+    """
+    Returns the declared column types of a table for 'to_sql', columns that are not declared are left out.
+    :param table_name: The name of the table.
+    :param columns: The columns of the DataFrame the table is created from.
+    """
+    declared = DECLARED_TABLES.get(table_name, {column: UUID for column in UUID_COLUMNS.get(table_name, [])})
+    return {column: declared[column] for column in columns if column in declared}
+
+
+def create_declared_indexes(conn, table_name, columns):
+    """
+    Creates the declared indexes of a table for the columns it has.
+    :param conn: A SQLAlchemy connection in a transaction.
+    :param table_name: The name of the table.
+    :param columns: The columns of the table.
+    """
+    for column_name in TABLE_INDEXES.get(table_name, []):
+        if column_name in columns:
+            conn.execute(text(f'CREATE INDEX IF NOT EXISTS "ix_{table_name}_{column_name}" '
+                              f'ON "public"."{table_name}" ("{column_name}");'))
+
+
+def insert_ignore_conflicts(table, conn, keys, data_iter):
+    """
+    'to_sql' insert method that skips the rows whose primary key already exists.
+    """
+    rows = [dict(zip(keys, row)) for row in data_iter]
+    result = conn.execute(postgresql.insert(table.table).values(rows).on_conflict_do_nothing())
+    return result.rowcount
 
 
 def initializer():
     """
-    Initializes and returns the automap base class for reflecting database tables.
+    Returns the automap base class for reflecting database tables. The base is cached in the reflection registry.
     """
-    Base = automap_base()
-    Base.prepare(autoload_with=sql_engine, schema='public')
-    return Base
+    return reflection_registry.get_base()
+
+
+class RowBuilder:
+    """
+    Collects records column by column and builds the DataFrame once, instead of concatenating one-row DataFrames.
+    The columns are the union of the record keys in first-seen order, and missing values are filled with NaN the
+    same way 'pd.concat' fills them. A column name is stored once instead of once per record, the parsers keep their
+    pass, linking record, state and zone rows in builders instead of lists of dictionaries.
+    """
+
+    def __init__(self, interned_columns=()):
+        """
+        :param interned_columns: Columns with few distinct values, e.g. the lists of shared field values. Equal values
+        of these columns are stored once.
+        """
+        self.columns = {}
+        self.row_count = 0
+        self.interned_columns = frozenset(interned_columns)
+        self.interned_values = {}
+
+    def __len__(self):
+        return self.row_count
+
+    def append(self, record):
+        """
+        Adds a record to the builder.
+        :param record: A dictionary of column names and values.
+        """
+        columns = self.columns
+        interned_columns = self.interned_columns
+        for key, value in record.items():
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = [np.nan] * self.row_count
+            if key in interned_columns:
+                value = self.interned_values.setdefault(value, value)
+            column.append(value)
+        self.row_count += 1
+        if len(record) != len(columns):
+            for key in columns.keys() - record.keys():
+                columns[key].append(np.nan)
+
+    def to_df(self):
+        """
+        Builds a DataFrame from the collected records. The column lists are released while the DataFrame is built,
+        so the builder is empty afterwards.
+        :return: The DataFrame, an empty DataFrame if no record was added.
+        """
+        if not self.row_count:
+            return pd.DataFrame()
+        columns = self.columns
+        self.columns = {}
+        self.row_count = 0
+        self.interned_values = {}
+        data = {}
+        for key in list(columns):
+            data[key] = pd.Series(columns.pop(key))  # The list is released once the column is converted
+        return pd.DataFrame(data)
 
 
 class BaseXMLParser:
@@ -87,24 +394,36 @@ class BaseXMLParser:
         dataframes.update(specific_dataframes)
         return dataframes
 
-    def create_project_df(self, project_name):
+    @staticmethod
+    def create_project_df(project_name):
         """
         Creates a DataFrame for a new project and loads it into the database, if the project does not already exist.
+        With the 'deterministic' ID strategy the ID is derived from the name, so the project is inserted without
+        looking it up first and an existing row is kept.
         
         :param project_name: The name of the project to create.
+        :return: The ID of the project.
         """
-        existing_project_id = self.projects_filter_method(project_name)
+        if id_strategy == 'deterministic':
+            project_id = generate_id('Project', project_name)
+            project_df = pd.DataFrame({'Project_ID': [project_id], 'ProjectName': [project_name]})
+            BaseXMLParser.load_to_db({'Project': project_df}, ignore_conflicts=True)
+            return project_id
+        existing_project_id = BaseXMLParser.projects_filter_method(project_name)
         if existing_project_id is None:
             project_id = uuid.uuid4()
             project_df = pd.DataFrame({'Project_ID': [project_id], 'ProjectName': [project_name]})
             project_dict = {'Project': project_df}
-            self.load_to_db(project_dict)
+            BaseXMLParser.load_to_db(project_dict)
+            return project_id
         else:
             print(f"Project '{project_name}' already exists with Project_ID {existing_project_id}.")
+            return existing_project_id
 
     @staticmethod
+    @metrics.timed('lookup')
     def projects_filter_method(project_name):
-        session = Session()
+        session = get_session()
         project_id = None
         Base = initializer()
         meta_data = Base.metadata
@@ -119,23 +438,30 @@ class BaseXMLParser:
 
     @staticmethod
     def update_project_names_with_deadline_outputs():
-        Base = initializer()
-        session = Session()
-
-        Project = Base.classes.Project
-        DeadlineSettings = Base.classes.DeadlineSettings
-        projects_with_deadlines = session.query(Project, DeadlineSettings).join(DeadlineSettings,
-                                                                                Project.Project_ID == DeadlineSettings.Project_ID).all()
-
-        for project, deadline in projects_with_deadlines:
-            project.ProjectName = deadline.Output
-
-        try:
-            session.commit()
-        except Exception as e:
-            session.rollback()
-        finally:
-            session.close()
+        """
+        Sets the name of every project that has deadline settings to their 'Output', with one set-based UPDATE.
+        Projects that already have that name are not rewritten.
+        :return: The number of updated projects.
+        """
+        if not (reflection_registry.has_table('Project') and reflection_registry.has_table('DeadlineSettings')):
+            return 0
+        updated_count = 0
+        with metrics.span('update_project_names') as span:
+            with get_engine().connect() as conn:
+                trans = conn.begin()
+                try:
+                    result = conn.execute(text(
+                        'UPDATE "public"."Project" AS p SET "ProjectName" = d."Output" '
+                        'FROM "public"."DeadlineSettings" AS d '
+                        'WHERE p."Project_ID" = d."Project_ID" AND p."ProjectName" IS DISTINCT FROM d."Output";'))
+                    trans.commit()
+                    updated_count = result.rowcount
+                except Exception as e:
+                    print("Update Project Names Error is:", e)
+                    trans.rollback()
+            span.set(rows=updated_count)
+        print(f"{updated_count} project names are updated with the deadline outputs.")
+        return updated_count
 
     @staticmethod
     def delete_exist_tables():
@@ -145,7 +471,7 @@ class BaseXMLParser:
         Base = initializer()  # Initialize the automap base class
         meta_data = Base.metadata  # Retrieve the metadata from the base class for getting table names
 
-        with sql_engine.connect() as conn:
+        with get_engine().connect() as conn:
             trans = conn.begin()
             try:
                 for table_name in meta_data.tables:
@@ -155,6 +481,55 @@ class BaseXMLParser:
                 print("Exist tables have been removed before starting the script")
             except Exception as e:
                 trans.rollback()
+        reflection_registry.invalidate()
+        table_schema_cache.invalidate()
+
+    @staticmethod
+    def bootstrap_schema():
+        """
+        Creates the declared tables that don't exist yet with their column types and primary keys, and the declared
+        indexes of all existing tables. Tables that already exist are not changed otherwise, so it can run before
+        every load.
+        """
+        metadata = MetaData()
+        for table_name, columns in DECLARED_TABLES.items():
+            primary_key = f'{table_name}_ID'
+            Table(table_name, metadata, *[Column(column_name, column_type, primary_key=column_name == primary_key)
+                                          for column_name, column_type in columns.items()], schema='public')
+        with schema_lock:
+            try:
+                with get_engine().begin() as conn:
+                    metadata.create_all(conn, checkfirst=True)
+                    inspector = inspect(conn)
+                    for table_name in TABLE_INDEXES:
+                        if inspector.has_table(table_name, schema='public'):
+                            columns = [column['name'] for column in inspector.get_columns(table_name, schema='public')]
+                            create_declared_indexes(conn, table_name, columns)
+            except Exception as e:
+                print("Bootstrap Schema Error is:", e)
+            reflection_registry.invalidate()
+            table_schema_cache.invalidate()
+
+    @staticmethod
+    def delete_file_rows(conn, project_id, table_names, file_type):
+        """
+        Deletes the rows a file loaded before, in the caller's transaction. Editor and State files of the same name
+        share a project, so only the tables the file loads are changed, and in the tables of FILE_TYPE_TABLES only
+        the rows of the file's type.
+        :param conn: A SQLAlchemy connection in a transaction.
+        :param project_id: The ID of the file's project.
+        :param table_names: The tables the file loads rows to.
+        :param file_type: The type of the file, 'Editor' or 'State'.
+        """
+        for table_name in table_names:
+            columns = table_schema_cache.get_columns(table_name)
+            if columns is None:
+                continue
+            condition = ' AND "Type" = :file_type' if table_name in FILE_TYPE_TABLES else ''
+            for column_name in ['Project_ID', 'Project_id']:
+                if column_name in columns:
+                    conn.execute(text(f'DELETE FROM "public"."{table_name}" WHERE "{column_name}" = :project_id'
+                                      f'{condition};'), {'project_id': str(project_id), 'file_type': file_type})
 
     @staticmethod
     def print_exist_tables():
@@ -164,7 +539,7 @@ class BaseXMLParser:
         Base = initializer()  # Initialize the automap base class
         meta_data = Base.metadata  # Retrieve the metadata from the base class for getting table names
 
-        with sql_engine.connect() as conn:
+        with get_engine().connect() as conn:
             trans = conn.begin()
             try:
                 for table_name in meta_data.tables:
@@ -181,7 +556,7 @@ class BaseXMLParser:
         Base = initializer()  # Initialize the automap base class
         meta_data = Base.metadata  # Retrieve the metadata from the base class for getting table names
 
-        with sql_engine.connect() as conn:
+        with get_engine().connect() as conn:
             trans = conn.begin()
             try:
                 for table_name in meta_data.tables:
@@ -192,86 +567,308 @@ class BaseXMLParser:
                 print("State and Zone tables have been removed.")
             except Exception as e:
                 trans.rollback()
+        reflection_registry.invalidate()
+        table_schema_cache.invalidate()
 
     @staticmethod
     def modify_jarvis_settings_table():
         """
-        Deletes the 'Description' column from the 'JarvisSettings' table using specific SQL query.
+        Deletes the 'Description' column from the 'JarvisSettings' table. PostgreSQL only marks a dropped column as
+        deleted, so the table is not rewritten. The rows are deduplicated when they are extracted, see
+        'EditorXMLParser.create_jarvis_settings_table'.
         """
         Base = initializer()  # Initialize the automap base class
         meta_data = Base.metadata  # Retrieve the metadata from the base class for getting table names
 
-        with sql_engine.connect() as conn:
+        with get_engine().connect() as conn:
             trans = conn.begin()
             try:
                 if 'public.JarvisSettings' in meta_data.tables:
-                    conn.execute(text(
-                        'DELETE From public."JarvisSettings" where "JarvisSettings_ID" in ( with a as (select "JarvisSettings_ID", row_number() over(partition by "Project_ID","FeatureCode" order by "Type" desc) queue from public."JarvisSettings")select "JarvisSettings_ID" from a where queue <> 1)'))
+                    conn.execute(text('ALTER TABLE "public"."JarvisSettings" DROP COLUMN IF EXISTS "Description";'))
                     trans.commit()
             except Exception as e:
+                print("Modify JarvisSettings Error is:", e)
                 trans.rollback()
+        reflection_registry.invalidate()
+        table_schema_cache.invalidate()
 
-    def load_to_db(self, dfs):
+    @staticmethod
+    def load_to_db(dfs, copy_threshold=None, ignore_conflicts=False, single_transaction=False, replaced_rows=None):
         """
         Loads a collection of DataFrames into the database, creating tables if they do not already exist.
-        """
-        inspector = inspect(sql_engine)  # Retrieve the inspector object for inspecting the database
+        Large DataFrames are streamed with COPY, smaller ones are inserted with 'to_sql'.
+        The reflection registry is invalidated when a table is created or gets a primary key.
+        :param dfs: A dictionary of table names and DataFrames.
+        :param copy_threshold: The row count from which COPY is used, COPY_THRESHOLD by default.
+        :param ignore_conflicts: If True, rows whose primary key already exists in a table are skipped.
+        :param single_transaction: If True, the DataFrames are loaded with 'load_to_db_in_transaction'.
+        :param replaced_rows: A tuple of (project ID, file type) whose rows are replaced, see
+        'load_to_db_in_transaction'. The DataFrames are then loaded in one transaction.
+        :return: True if all DataFrames were loaded, False if a DataFrame failed to load.
+        """
+        if single_transaction or replaced_rows is not None:
+            return BaseXMLParser.load_to_db_in_transaction(dfs, copy_threshold, ignore_conflicts, replaced_rows)
+        inspector = inspect(get_engine())  # Retrieve the inspector object for inspecting the database
+        schema_changed = False
+        loaded = True
+        if copy_threshold is None:
+            copy_threshold = COPY_THRESHOLD
 
         for table_name, df in dfs.items():
             if not df.empty:
-                try:
-                    tables_in_db = inspector.get_table_names()
-                    if table_name not in tables_in_db:
-                        df.to_sql(table_name, sql_engine, index=False)
-
-                    else:
-                        db_columns = inspector.get_columns(table_name)
-                        db_column_names = [col['name'] for col in db_columns]
-                        df = df.reindex(columns=db_column_names, fill_value=None)
-                        df.to_sql(table_name, sql_engine, if_exists='append', index=False)
-
-                except Exception as e:
-                    print("Load to DB Error is:", e)
-
-                with sql_engine.connect() as conn:
-                    trans = conn.begin()
-                    try:
-                        primary_keys = inspector.get_pk_constraint(table_name)
-                        pk_columns = primary_keys.get('constrained_columns', [])
-
-                        if not pk_columns and table_name != 'ChaosCloudSettings':
-                            print(f"Adding primary key to 'public.{table_name}'")
-                            conn.execute(
-                                text(f'ALTER TABLE "public"."{table_name}" ADD PRIMARY KEY ("{table_name}_ID");'))
-                        if not pk_columns and table_name == 'ChaosCloudSettings':
-                            print(f"Adding primary key to 'public.{table_name}'")
-                            conn.execute(
-                                text(f'ALTER TABLE "public"."{table_name}" ADD PRIMARY KEY ("Project_ID");'))
-                        trans.commit()
-                    except Exception as e:
-                        print("Primary Key Error is:", e)
-                        trans.rollback()
+                with metrics.span('load', table=table_name) as span:
+                    span.set(rows=len(df))
+                    use_copy = len(df) >= copy_threshold
+                    new_table = table_name not in inspector.get_table_names()
+                    ''' New tables are created and get their primary key under the schema lock '''
+                    with schema_lock if new_table else nullcontext():
+                        if new_table and inspect(get_engine()).has_table(table_name):
+                            new_table = False  # Another loader thread created it after the names were cached
+                            inspector = inspect(get_engine())
+                        try:
+                            if new_table and ignore_conflicts:
+                                ''' Conflicts are found by the primary key, so it is added before the rows '''
+                                BaseXMLParser.create_table(table_name, df)
+                                if use_copy:
+                                    BaseXMLParser.copy_to_db(table_name, df, ignore_conflicts)
+                                else:
+                                    df.to_sql(table_name, get_engine(), if_exists='append', index=False,
+                                              method=insert_ignore_conflicts)
+                                schema_changed = True
+
+                            elif new_table:
+                                dtype = declared_dtypes(table_name, df.columns)
+                                if use_copy:
+                                    df.head(0).to_sql(table_name, get_engine(), index=False, dtype=dtype)  # Table only
+                                    BaseXMLParser.copy_to_db(table_name, df)
+                                else:
+                                    df.to_sql(table_name, get_engine(), index=False, dtype=dtype)
+                                schema_changed = True
+
+                            else:
+                                db_columns = inspector.get_columns(table_name)
+                                db_column_names = [col['name'] for col in db_columns]
+                                df = df.reindex(columns=db_column_names, fill_value=None)
+                                if use_copy:
+                                    BaseXMLParser.copy_to_db(table_name, df, ignore_conflicts)
+                                else:
+                                    df.to_sql(table_name, get_engine(), if_exists='append', index=False,
+                                              method=insert_ignore_conflicts if ignore_conflicts else None)
+
+                        except Exception as e:
+                            print("Load to DB Error is:", e)
+                            loaded = False
+                        with get_engine().connect() as conn:
+                            trans = conn.begin()
+                            try:
+                                primary_keys = inspector.get_pk_constraint(table_name)
+                                pk_columns = primary_keys.get('constrained_columns', [])
+
+                                if not pk_columns and table_name != 'ChaosCloudSettings':
+                                    print(f"Adding primary key to 'public.{table_name}'")
+                                    conn.execute(text(
+                                        f'ALTER TABLE "public"."{table_name}" ADD PRIMARY KEY ("{table_name}_ID");'))
+                                if not pk_columns and table_name == 'ChaosCloudSettings':
+                                    print(f"Adding primary key to 'public.{table_name}'")
+                                    conn.execute(
+                                        text(f'ALTER TABLE "public"."{table_name}" ADD PRIMARY KEY ("Project_ID");'))
+                                trans.commit()
+                                schema_changed = schema_changed or not pk_columns
+                            except Exception as e:
+                                print("Primary Key Error is:", e)
+                                trans.rollback()
+                        if new_table:
+                            try:
+                                with get_engine().begin() as conn:
+                                    create_declared_indexes(conn, table_name, df.columns)
+                            except Exception as e:
+                                print("Index Error is:", e)
             else:
                 continue
+        if schema_changed:
+            reflection_registry.invalidate()
+            table_schema_cache.invalidate()
+        return loaded
+
+    @staticmethod
+    def load_to_db_in_transaction(dfs, copy_threshold=None, ignore_conflicts=False, replaced_rows=None):
+        """
+        Loads a collection of DataFrames, e.g. all tables of one file, in one transaction. The column names come from
+        the table schema cache, so existing tables are not inspected. Missing tables are created with their primary
+        key in a short transaction of their own first, so other loader threads can use them right away.
+        If a write fails, no row of the collection is loaded.
+        :param dfs: A dictionary of table names and DataFrames.
+        :param copy_threshold: The row count from which COPY is used, COPY_THRESHOLD by default.
+        :param ignore_conflicts: If True, rows whose primary key already exists in a table are skipped.
+        :param replaced_rows: A tuple of (project ID, file type). The rows a file of this type loaded to the tables of
+        the collection before are deleted in the same transaction, see 'delete_file_rows'.
+        :return: True if the collection was loaded, False if the transaction was rolled back.
+        """
+        if copy_threshold is None:
+            copy_threshold = COPY_THRESHOLD
+        table_names = list(dfs)
+        dfs = {table_name: df for table_name, df in dfs.items() if not df.empty}
+        for table_name, df in dfs.items():
+            if table_schema_cache.get_columns(table_name) is None:
+                BaseXMLParser.create_table(table_name, df)
+
+        try:
+            with get_engine().begin() as conn:
+                if replaced_rows is not None:
+                    project_id, file_type = replaced_rows
+                    BaseXMLParser.delete_file_rows(conn, project_id, table_names, file_type)
+                for table_name, df in dfs.items():
+                    with metrics.span('load', table=table_name) as span:
+                        span.set(rows=len(df))
+                        df = df.reindex(columns=table_schema_cache.get_columns(table_name), fill_value=None)
+                        if len(df) >= copy_threshold:
+                            with conn.connection.cursor() as cursor:
+                                BaseXMLParser.copy_with_cursor(cursor, table_name, df, ignore_conflicts)
+                        else:
+                            BaseXMLParser.insert_rows(conn, table_name, df, ignore_conflicts)
+        except Exception as e:
+            print("Load to DB Error is:", e)
+            return False
+        return True
+
+    @staticmethod
+    def create_table(table_name, df):
+        """
+        Creates a table for the DataFrame's columns with its primary key, and adds it to the table schema cache.
+        The primary key is '<table_name>_ID', or 'Project_ID' for 'ChaosCloudSettings'.
+        :param table_name: The name of the table to create.
+        :param df: A DataFrame with the columns of the table.
+        """
+        with schema_lock:
+            table_schema_cache.invalidate()  # Another thread may have created it
+            if table_schema_cache.get_columns(table_name) is not None:
+                return
+            primary_key = 'Project_ID' if table_name == 'ChaosCloudSettings' else f'{table_name}_ID'
+            with get_engine().begin() as conn:
+                df.head(0).to_sql(table_name, conn, index=False, dtype=declared_dtypes(table_name, df.columns))
+                if primary_key in df.columns:
+                    print(f"Adding primary key to 'public.{table_name}'")
+                    conn.execute(text(f'ALTER TABLE "public"."{table_name}" ADD PRIMARY KEY ("{primary_key}");'))
+                create_declared_indexes(conn, table_name, df.columns)
+            table_schema_cache.add_table(table_name, df.columns)
+            reflection_registry.invalidate()
+
+    @staticmethod
+    def insert_rows(conn, table_name, df, ignore_conflicts=False):
+        """
+        Inserts the rows of a DataFrame with one multi-row INSERT statement per batch on the given connection.
+        Missing values are inserted as NULL like 'to_sql' does.
+        :param conn: A SQLAlchemy connection in a transaction.
+        :param table_name: The name of the table, the DataFrame's columns must exist in it.
+        :param df: The DataFrame to insert.
+        :param ignore_conflicts: If True, rows whose primary key already exists are skipped.
+        """
+        table_obj = table(table_name, *[column(column_name) for column_name in df.columns], schema='public')
+        statement = postgresql.insert(table_obj)
+        if ignore_conflicts:
+            statement = statement.on_conflict_do_nothing()
+        values = df.astype(object).where(df.notna(), None)
+        rows = [dict(zip(df.columns, row)) for row in values.itertuples(index=False, name=None)]
+        conn.execute(statement, rows)
+
+    @staticmethod
+    def copy_to_db(table_name, df, ignore_conflicts=False):
+        """
+        Streams a DataFrame into an existing table with 'COPY FROM STDIN' in CSV format.
+        :param table_name: The name of the table to load.
+        :param df: The DataFrame to load, its columns must exist in the table.
+        :param ignore_conflicts: If True, the rows are copied into a temporary table first and only the rows whose
+        primary key doesn't exist are inserted.
+        """
+        connection = get_engine().raw_connection()
+        try:
+            with connection.cursor() as cursor:
+                BaseXMLParser.copy_with_cursor(cursor, table_name, df, ignore_conflicts)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+
+    @staticmethod
+    def copy_with_cursor(cursor, table_name, df, ignore_conflicts=False):
+        """
+        Runs the COPY of 'copy_to_db' with a DBAPI cursor, the caller commits the transaction.
+        :param cursor: A cursor of a psycopg2 connection.
+        :param table_name: The name of the table to load.
+        :param df: The DataFrame to load, its columns must exist in the table.
+        :param ignore_conflicts: If True, only the rows whose primary key doesn't exist are inserted.
+        """
+        buffer = BaseXMLParser.to_copy_buffer(df)
+        columns = ', '.join(f'"{column}"' for column in df.columns)
+        target = 'copy_staging' if ignore_conflicts else f'"public"."{table_name}"'
+        copy_sql = f'COPY {target} ({columns}) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')'
+        metrics.add_round_trips(4 if ignore_conflicts else 1)  # Raw cursor statements are not counted by events
+        if ignore_conflicts:
+            cursor.execute(f'CREATE TEMPORARY TABLE copy_staging (LIKE "public"."{table_name}") ON COMMIT DROP')
+        cursor.copy_expert(copy_sql, buffer)
+        if ignore_conflicts:
+            cursor.execute(f'INSERT INTO "public"."{table_name}" ({columns}) SELECT {columns} '
+                           'FROM copy_staging ON CONFLICT DO NOTHING')
+            cursor.execute('DROP TABLE copy_staging')  # The transaction may copy into another table
+
+    @staticmethod
+    def to_copy_buffer(df):
+        """
+        Writes a DataFrame to an in-memory CSV buffer for COPY. Missing values are written as '\\N' and list-valued
+        cells as array literals, UUIDs and other objects are written as text.
+        :param df: The DataFrame to write.
+        :return: A StringIO buffer positioned at the start.
+        """
+        list_columns = {}
+        for column in df.columns:
+            series = df[column]
+            if series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) not in ('string', 'empty'):
+                is_list = series.map(lambda value: isinstance(value, (list, tuple)))
+                if is_list.any():
+                    list_columns[column] = series.where(~is_list, series[is_list].map(to_array_literal))
+        if list_columns:
+            df = df.assign(**list_columns)
+
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False, header=False, na_rep='\\N')
+        buffer.seek(0)
+        return buffer
 
 
 class EditorXMLParser(BaseXMLParser):
     """
     EditorXMLParser is a subclass of BaseXMLParser that provides methods for extracting 'Editor XML' data
     """
+    file_type = 'Editor'
 
-    def __init__(self, new_root, path):
+    def __init__(self, new_root, path, streaming=False, state_index=None):
         """
         Initializes the EditorXMLParser with a given root and file path.
-        :param new_root: The root element of the XML document.
+        :param new_root: The root element of the XML document. It can be None in streaming mode.
         :param path: The file path to the XML document.
+        :param streaming: If True, passes are read with 'iterparse' from the path instead of the parsed tree.
+        :param state_index: A dictionary mapping (Project_ID, state name) to State_IDs. If None, it is loaded from the
+        'State' table with one query when the first pass is processed.
         """
         super().__init__(new_root, path)
+        self.streaming = streaming
+        self.state_index = state_index
         self.editor_dataframes = {}
-        self.linkinrecords_dicts = []
-        self.basepass_dicts = []
-        self.optionpass_dicts = []
-        self.records_dicts = []
+        self.linking_record_rows = RowBuilder()
+        self.render_pass_rows = RowBuilder(interned_columns=NormalizerUtils.shared_fields + ['State'])
+
+    def extract_all_data_to_df(self, project_id):
+        """
+        Extracts all relevant data for a given project ID into a collection of DataFrames.
+        In streaming mode the passes are collected first, so the settings are read from the remaining tree.
+        :param project_id: The ID of the project for which data is being extracted.
+        :return: A dictionary of DataFrames containing extracted data.
+        """
+        if self.streaming:
+            self.stream_passes(project_id)
+        return super().extract_all_data_to_df(project_id)
 
     def extract_data_to_df(self, project_id):
         """
@@ -295,14 +892,17 @@ class EditorXMLParser(BaseXMLParser):
         :param root_name: The name of the root element.
         :return: A dictionary containing the DataFrame for the root element.
         """
-        root_df = pd.DataFrame()
+        root_rows = RowBuilder()
         for record in self.root.findall(f'.//{root_name}'):
             record_data = {attr: record.get(attr).replace('\n', '') for attr in record.attrib}
-            if root_name != 'ChaosCloudSettings':
-                record_data[f'{root_name}_ID'] = uuid.uuid4()
+            if root_name == 'ProjectSettings':
+                ''' The State file of the project has ProjectSettings rows too, the type is part of their key '''
+                record_data[f'{root_name}_ID'] = generate_id(root_name, project_id, self.file_type, len(root_rows))
+            elif root_name != 'ChaosCloudSettings':
+                record_data[f'{root_name}_ID'] = generate_id(root_name, project_id, len(root_rows))
             record_data['Project_ID'] = project_id
             if root_name == 'ProjectSettings':
-                record_data['Type'] = 'Editor'
+                record_data['Type'] = self.file_type
             if root_name == 'ChaosCloudSettings':
                 vr_scene = record.get('VrScene')
                 record_data['VrScene'] = vr_scene.replace('\n', '') if vr_scene is not None else None
@@ -311,10 +911,9 @@ class EditorXMLParser(BaseXMLParser):
                 if value is None:
                     record_data[key] = ''
 
-            current_df = pd.DataFrame([record_data])
-            root_df = pd.concat([root_df, current_df], ignore_index=True)
+            root_rows.append(record_data)
 
-        return {root_name: root_df}
+        return {root_name: root_rows.to_df()}
 
     def to_get_descriptions_data_as_dict(self):
         """ 
@@ -328,22 +927,28 @@ class EditorXMLParser(BaseXMLParser):
     def create_jarvis_settings_table(self, project_id):
         """
         Creates a DataFrame for the 'JarvisSettings' table from the XML document.
+        A feature code gets one row, with the highest 'Type' of its elements (in the order 'Trim', 'Paint', 'Extra',
+        'Description'), so duplicates are not loaded.
         :param project_id: The ID of the project for which data is being extracted.
         :return: A dictionary containing the 'JarvisSettings' DataFrame.
         """
         descriptions_dict = self.to_get_descriptions_data_as_dict()
-        data = []
+        feature_code_types = {}
         for category in ['Paints', 'Trims', 'Extras', 'Descriptions']:
             for item in self.root.findall(f'.//{category}/{category[:-1]}'):
                 feature_code = item.get('FeatureCode')
-                description = descriptions_dict.get(feature_code, '')
-                data.append({
-                    'JarvisSettings_ID': uuid.uuid4(),
-                    'Project_ID': project_id,
-                    'FeatureCode': feature_code,
-                    'Type': category[:-1],
-                    'Description': description
-                })
+                item_type = category[:-1]
+                if feature_code not in feature_code_types or item_type > feature_code_types[feature_code]:
+                    feature_code_types[feature_code] = item_type
+        data = []
+        for feature_code, item_type in feature_code_types.items():
+            data.append({
+                'JarvisSettings_ID': generate_id('JarvisSettings', project_id, len(data)),
+                'Project_ID': project_id,
+                'FeatureCode': feature_code,
+                'Type': item_type,
+                'Description': descriptions_dict.get(feature_code, '')
+            })
 
         jarvis_settigs_df = pd.DataFrame(data)
 
@@ -364,25 +969,82 @@ class EditorXMLParser(BaseXMLParser):
         :param project_id: The ID of the project for which data is being extracted.
         :return: A dictionary of DataFrames containing extracted data.
         """
-        for linking_record in self.root.findall('.//linkingrecord'):
-            linking_record_data = {attr: linking_record.get(attr).replace('\n', '') for attr in linking_record.attrib}
-            linking_record_id = uuid.uuid4()
-            linking_record_data['LinkingRecords_ID'] = linking_record_id
-            linking_record_data['Project_ID'] = project_id
-            self.linkinrecords_dicts.append(linking_record_data)
-            for base_pass in linking_record.findall('.//BasePass'):
-                base_pass_id = uuid.uuid4()
-                self.process_pass(base_pass, 'BasePass', base_pass_id, linking_record_id, project_id)
-                for option_pass in base_pass.findall('.//OptionPass'):
-                    option_pass_id = uuid.uuid4()
-                    self.process_pass(option_pass, 'OptionPass', option_pass_id, base_pass_id, project_id)
-
-        render_pass_df = pd.DataFrame(self.records_dicts)
-        linking_record_df = pd.DataFrame(self.linkinrecords_dicts)
+        if not self.streaming:
+            for linking_record in self.root.findall('.//linkingrecord'):
+                linking_record_id = self.process_linking_record(linking_record, project_id)
+                for base_pass in linking_record.findall('.//BasePass'):
+                    base_pass_id = self.next_pass_id(project_id)
+                    self.process_pass(base_pass, 'BasePass', base_pass_id, linking_record_id, project_id)
+                    for option_pass in base_pass.findall('.//OptionPass'):
+                        option_pass_id = self.next_pass_id(project_id)
+                        self.process_pass(option_pass, 'OptionPass', option_pass_id, base_pass_id, project_id)
+
+        render_pass_df = self.render_pass_rows.to_df()
+        linking_record_df = self.linking_record_rows.to_df()
 
         return {'RenderPass': render_pass_df,
                 'LinkingRecords': linking_record_df}
 
+    def stream_passes(self, project_id):
+        """
+        Reads 'linkingrecord', 'BasePass' and 'OptionPass' elements with 'iterparse' and processes them in document order.
+        Pass elements are removed from the tree when they close, so memory does not grow with the number of passes.
+        The remaining tree (settings, Jarvis data) is kept as the root for the other extract methods.
+        :param project_id: The ID of the project for which data is being extracted.
+        """
+        parents = []
+        linking_record_id = None
+        base_pass_id = None
+        root = None
+        for event, element in ET.iterparse(self.path, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = element
+                if element.tag == 'linkingrecord':
+                    linking_record_id = self.process_linking_record(element, project_id)
+                elif element.tag == 'BasePass' and linking_record_id is not None:
+                    base_pass_id = self.next_pass_id(project_id)
+                    self.process_pass(element, 'BasePass', base_pass_id, linking_record_id, project_id)
+                elif element.tag == 'OptionPass' and base_pass_id is not None:
+                    option_pass_id = self.next_pass_id(project_id)
+                    self.process_pass(element, 'OptionPass', option_pass_id, base_pass_id, project_id)
+                parents.append(element)
+                continue
+
+            parents.pop()
+            if element.tag == 'linkingrecord':
+                linking_record_id = None
+                if parents:
+                    parents[-1].remove(element)  # Drop the finished record with all of its passes
+            elif element.tag == 'BasePass':
+                base_pass_id = None
+                element.clear()
+            elif element.tag == 'OptionPass':
+                element.clear()
+        self.root = root
+
+    def process_linking_record(self, linking_record, project_id):
+        """
+        Processes a 'linkingrecord' element from the XML document.
+        :param linking_record: The XML element representing the linking record.
+        :param project_id: The ID of the project.
+        :return: The ID of the linking record as a string, its base passes share the string.
+        """
+        linking_record_data = {attr: linking_record.get(attr).replace('\n', '') for attr in linking_record.attrib}
+        linking_record_id = generate_id('LinkingRecords', project_id, len(self.linking_record_rows))
+        linking_record_data['LinkingRecords_ID'] = linking_record_id
+        linking_record_data['Project_ID'] = project_id
+        self.linking_record_rows.append(linking_record_data)
+        return str(linking_record_id)
+
+    def next_pass_id(self, project_id):
+        """
+        Generates the ID of the next pass, the key of a pass is its position in the document.
+        :param project_id: The ID of the project.
+        :return: The ID of the pass as a string, the option passes of a base pass share the string.
+        """
+        return str(generate_id('RenderPass', project_id, len(self.render_pass_rows)))
+
     def process_pass(self, pass_element, pass_type, pass_id, parent_id, project_id):
         """
         Processes a 'BasePass' or 'OptionPass' element from the XML document.
@@ -406,18 +1068,63 @@ class EditorXMLParser(BaseXMLParser):
             parent_id) if pass_type == 'BasePass' else None  # Set LinkingRecord_ID if BasePass
         pass_data['RenderedScenes'] = None
         pass_data['Project_ID'] = project_id
-        ''' State_ID is added to pass_data '''
-        # TODO: If this line in comment, it takes a lot of time to upload data to database.
-        # pass_data['State_ID'] = self.state_filter_method(pass_data['State']) if 'State' in pass_data and pass_data['State'] else None
-        self.records_dicts.append(pass_data)  # Append pass data to records_dicts list
+        ''' State_ID is added to pass_data from the state index instead of a query per pass '''
+        state_name = pass_data.get('State')
+        pass_data['State_ID'] = self.get_state_index().get((str(project_id), state_name)) if state_name else None
+        self.render_pass_rows.append(pass_data)
+
+    def get_state_index(self):
+        """
+        Returns the state index of the parser, it is loaded from the database once if it wasn't given.
+        :return: A dictionary mapping (Project_ID, state name) to State_IDs.
+        """
+        if self.state_index is None:
+            self.state_index = self.state_index_filter_method()
+        return self.state_index
 
     @staticmethod
+    def build_state_index(state_df, state_index=None):
+        """
+        Builds a state index from a 'State' DataFrame produced by StateXMLParser.
+        States are keyed by project, an Editor file gets the states of the State file of the same project. Within a
+        project the first State_ID of a name is kept, keys that are already in the index are not changed.
+        :param state_df: The 'State' DataFrame.
+        :param state_index: An existing state index to extend.
+        :return: A dictionary mapping (Project_ID, state name) to State_IDs.
+        """
+        state_index = {} if state_index is None else state_index
+        if not state_df.empty and 'Name' in state_df.columns:
+            for project_id, state_name, state_id in zip(state_df['Project_id'], state_df['Name'], state_df['State_ID']):
+                state_index.setdefault((str(project_id), state_name), str(state_id))
+        return state_index
+
+    @staticmethod
+    @metrics.timed('lookup')
+    def state_index_filter_method():
+        """
+        Loads the projects, names and State_IDs of all states from the 'State' table with one query. The rows are
+        ordered, so a name that occurs twice in a project always gets the same State_ID.
+        :return: A dictionary mapping (Project_ID, state name) to State_IDs.
+        """
+        state_index = {}
+        states_table = reflection_registry.get_table('State')
+        if states_table is not None and 'Name' in states_table.columns:
+            columns = states_table.c
+            query = select(columns.Project_id, columns.Name, columns.State_ID).order_by(
+                columns.Project_id, columns.Name, columns.State_ID)
+            with get_engine().connect() as conn:
+                for project_id, state_name, state_id in conn.execute(query):
+                    state_index.setdefault((str(project_id), state_name), str(state_id))
+        return state_index
+
+    @staticmethod
+    @metrics.timed('lookup')
     def state_filter_method(state_name):
         """
         Filters the 'State' table by name and returns the corresponding State_ID.
         :param state_name: The name of the state to filter.
         :return: The ID of the state if found, otherwise None."""
-        session = Session()
+        session = get_session()
         state_id = None
         Base = initializer()
         meta_data = Base.metadata
@@ -435,6 +1142,7 @@ class StateXMLParser(BaseXMLParser):
     """
     StateXMLParser is a subclass of BaseXMLParser that provides methods for extracting 'State XML' data
     """
+    file_type = 'State'
 
     def __init__(self, new_root, path):
         """
@@ -443,9 +1151,9 @@ class StateXMLParser(BaseXMLParser):
         :param path: The file path to the XML document."""
         super().__init__(new_root, path)
         self.state_dataframes = {}
-        self.states_settings_dict = []
-        self.state_dict = []
-        self.zone_dict = []
+        self.states_settings_rows = RowBuilder()
+        self.state_rows = RowBuilder(interned_columns=['Layers', 'Assignments', 'MaterialNames', 'ZonesNames'])
+        self.zone_rows = RowBuilder(interned_columns=['Name', 'Material', 'Zone'])
 
     def extract_data_to_df(self, project_id):
         """
@@ -463,14 +1171,16 @@ class StateXMLParser(BaseXMLParser):
         :param project_id: The ID of the project for which data is being extracted.
         :return: A dictionary containing the 'ProjectSettings' DataFrame.
         """
+        project_settings_rows = RowBuilder()
         for record in self.root.findall('.//ProjectSettings'):
             record_data = {attr: record.get(attr).replace('\n', '') for attr in record.attrib}
-            record_data['ProjectSettings_ID'] = uuid.uuid4()
+            record_data['ProjectSettings_ID'] = generate_id('ProjectSettings', project_id, self.file_type,
+                                                            len(project_settings_rows))
             record_data['Project_ID'] = project_id
-            record_data['Type'] = 'State'
-            state_project_settings_df = pd.DataFrame([record_data])
+            record_data['Type'] = self.file_type
+            project_settings_rows.append(record_data)
 
-        return {'ProjectSettings': state_project_settings_df}
+        return {'ProjectSettings': project_settings_rows.to_df()}
 
     def handle_additional_data(self, project_id):
         """
@@ -491,9 +1201,10 @@ class StateXMLParser(BaseXMLParser):
 
         for state_setting in self.root.findall('.//StatesSettings'):
             state_setting_data = {attr: state_setting.get(attr).replace('\n', '') for attr in state_setting.attrib}
-            state_setting_data['StateSettings_ID'] = uuid.uuid4()
+            state_setting_data['StateSettings_ID'] = generate_id('StateSettings', project_id,
+                                                                 len(self.states_settings_rows))
             state_setting_data['Project_ID'] = project_id
-            self.states_settings_dict.append(state_setting_data)
+            self.states_settings_rows.append(state_setting_data)
 
             for state in state_setting.findall('.//State'):
                 state_data = {attr: state.get(attr).replace('\n', '') for attr in state.attrib}
@@ -501,7 +1212,7 @@ class StateXMLParser(BaseXMLParser):
                     layers_data = [item for item in state_data['Layers'].split(',') if item]
                     layers_str = ", ".join(layers_data)
                     state_data['Layers'] = f"({layers_str})"
-                state_data['State_ID'] = uuid.uuid4()
+                state_data['State_ID'] = generate_id('State', project_id, len(self.state_rows))
                 state_data['StateSettings_ID'] = state_setting_data['StateSettings_ID']
                 state_data['Project_id'] = project_id
                 state_data['ZonesNames'] = []
@@ -511,38 +1222,45 @@ class StateXMLParser(BaseXMLParser):
                 for zone in state.findall('.//Zone'):
                     zone_data = {attr: zone.get(attr).replace('\n', '') for attr in zone.attrib}
                     zone_data['State_ID'] = state_data['State_ID']
-                    zone_data['Zone_ID'] = uuid.uuid4()
+                    zone_data['Zone_ID'] = generate_id('Zone', project_id, len(self.zone_rows))
                     zone_data['Project_ID'] = project_id
                     state_data['Assignments'].append(zone_data['Name'])
                     state_data['MaterialNames'].append(zone_data['Material'])
                     state_data['ZonesNames'].append(zone_data['Zone'])
-                    self.zone_dict.append(zone_data)
+                    self.zone_rows.append(zone_data)
 
                 fields = ['Assignments', 'MaterialNames', 'ZonesNames']
                 for field in fields:
                     zones_str = "(" + ', '.join(zone_name for zone_name in state_data[field]) + ")"
                     state_data[field] = zones_str
-                self.state_dict.append(state_data)
+                self.state_rows.append(state_data)
 
-        return pd.DataFrame(self.states_settings_dict), pd.DataFrame(self.state_dict), pd.DataFrame(self.zone_dict)
+        return self.states_settings_rows.to_df(), self.state_rows.to_df(), self.zone_rows.to_df()
 
 
 class NormalizerUtils:
     """
     A utility class for normalizing data extracted from XML documents.
     """
-    def __init__(self, render_pass_df):
+    shared_fields = ['FeatureCodes', 'Layers', 'Lighting', 'Zones', 'RenderedScenes', 'Exclude', 'Include']
+
+    def __init__(self, render_pass_df, session=None):
         """
         Initializes the NormalizerUtils with a DataFrame containing extracted render pass data.
         :param render_pass_df: The DataFrame containing render pass data to normalize.
+        :param session: A NormalizerSession, its ID maps and lookup rows are used instead of per-file ones.
         """
         self.render_pass_df = render_pass_df
-        self.shared_fields = ['FeatureCodes', 'Layers', 'Lighting', 'Zones', 'RenderedScenes', 'Exclude', 'Include']
         self.shared_fields_dfs = {field: pd.DataFrame(columns=[f'{field}_ID', f'{field}Names', 'Version', 'User']) for
                                   field in
                                   self.shared_fields}
-        self.field_id_maps = {field: {} for field in self.shared_fields}
-        self.accumulated_new_rows = {field: [] for field in self.shared_fields}
+        self.session = session
+        if session is not None:
+            self.field_id_maps = session.field_id_maps
+            self.lookup_builders = session.lookup_builders
+        else:
+            self.field_id_maps = {field: {} for field in self.shared_fields}
+            self.lookup_builders = {field: RowBuilder() for field in self.shared_fields}
 
     def extract_shared_fields(self):
         """
@@ -550,23 +1268,32 @@ class NormalizerUtils:
         """
         for field in self.shared_fields:
             if field in self.render_pass_df.columns:
-                unique_items = self.render_pass_df[field].dropna().unique().tolist()
-                value_id_map = self.filter_method(field, unique_items)
+                _, uniques = pd.factorize(self.render_pass_df[field])  # Hash-based unique values, NaN excluded
+                unique_items = uniques.tolist()
+                if self.session is not None:
+                    value_id_map = {}  # The session loaded the lookup tables into field_id_maps already
+                elif id_strategy == 'deterministic':
+                    value_id_map = {}  # Existing rows have the same IDs, they are skipped when the rows are loaded
+                else:
+                    value_id_map = self.filter_method(field, unique_items)
+                field_id_map = self.field_id_maps[field]
                 items_not_in_map = [item for item in unique_items if
-                                    str(item) not in value_id_map and str(item) not in self.field_id_maps[field]]
-                field_ids = [str(uuid.uuid4()) for _ in items_not_in_map]
+                                    str(item) not in value_id_map and str(item) not in field_id_map]
+                field_ids = [str(generate_id(field, item)) for item in items_not_in_map]
                 self.make_lookup_tables(field, items_not_in_map, field_ids)
 
+                new_item_ids = dict(zip(items_not_in_map, field_ids))
                 for item in unique_items:
-                    if str(item) in value_id_map:
-                        self.field_id_maps[field][str(item)] = value_id_map[str(item)]
-                    elif str(item) in items_not_in_map:
-                        index = items_not_in_map.index(str(item))
-                        self.field_id_maps[field][str(item)] = field_ids[index]
+                    key = str(item)
+                    if key in value_id_map:
+                        field_id_map[key] = value_id_map[key]
+                    elif key in new_item_ids:
+                        field_id_map[key] = new_item_ids[key]
 
     def make_lookup_tables(self, field, items_not_in_map, field_ids):
         """
-        Creates lookup tables for shared fields that are not already in the database.
+        Creates lookup rows for shared fields that are not already in the database.
+        The rows are collected in the field's RowBuilder, the lookup table is built once in 'finalize_shared_fields_dfs'.
         :param field: The name of the field to create a lookup table for.
         :param items_not_in_map: A list of items not already in the database.
         :param field_ids: A list of IDs for the items not already in the database.
@@ -590,191 +1317,181 @@ class NormalizerUtils:
         elif field == 'RenderedScenes':
             if not items_not_in_map:
                 default_item = 'DefaultMaxScenes'
-                default_id = str(uuid.uuid4())
-                lookup_rows = [self.create_rendered_scenes_lookup(field, default_id, default_item)]
+                default_id = str(generate_id(field, default_item))
+                if id_strategy == 'deterministic' and default_item in self.field_id_maps[field]:
+                    lookup_rows = []  # The default row has the same ID in every file, it is created once
+                else:
+                    lookup_rows = [self.create_rendered_scenes_lookup(field, default_id, default_item)]
+                    if id_strategy == 'deterministic':
+                        self.field_id_maps[field][default_item] = default_id
             else:
                 lookup_rows = [self.create_rendered_scenes_lookup(field, field_id, item) for item, field_id in
                                zip(items_not_in_map, field_ids)]
         else:
-            lookup_rows = [pd.DataFrame({f'{field}_ID': [field_id], f'{field}Names': [item], 'Version': 1, 'User': ''})
+            lookup_rows = [{f'{field}_ID': field_id, f'{field}Names': item, 'Version': 1, 'User': ''}
                            for item, field_id in zip(items_not_in_map, field_ids)]
-        self.accumulated_new_rows[field].extend(lookup_rows)
+        lookup_builder = self.lookup_builders[field]
+        for lookup_row in lookup_rows:
+            lookup_builder.append(lookup_row)
 
     def create_zones_lookup(self, field, items, field_ids):
         """
-        Creates a lookup table for 'Zones' based on the extracted data.
+        Creates lookup rows for 'Zones' based on the extracted data.
         :param field: The name of the field to create a lookup table for.
         :param items: A list of items to create lookup rows for.
         :param field_ids: A list of IDs for the items.
-        :return: A list of DataFrames containing lookup rows.
+        :return: A list of dictionaries containing lookup rows.
         """
         zone_details = self.state_filter_method(items)
         lookup_rows = []
         for item, field_id in zip(items, field_ids):
             if item in zone_details:
                 details = zone_details[item]
-                new_row = pd.DataFrame({
-                    f'{field}_ID': [field_id],
-                    'StateName': [details['StateName']],
-                    'State_ID': [details['State_ID']],
-                    'ZonesNames': [details['ZoneNames']],
-                    'MaterialNames': [details['MaterialNames']],
-                    'Assignments': [details['Assignments']],
-                    'Version': [1],
+                lookup_rows.append({
+                    f'{field}_ID': field_id,
+                    'StateName': details['StateName'],
+                    'State_ID': details['State_ID'],
+                    'ZonesNames': details['ZoneNames'],
+                    'MaterialNames': details['MaterialNames'],
+                    'Assignments': details['Assignments'],
+                    'Version': 1,
                     'User': ''
                 })
-                lookup_rows.append(new_row)
         return lookup_rows
 
     def create_layers_lookup(self, field, items, field_ids):
         """
-        Creates a lookup table for 'Layers' based on the extracted data.
+        Creates lookup rows for 'Layers' based on the extracted data, a layer gets one row with its first state.
         :param field: The name of the field to create a lookup table for.
         :param items: A list of items to create lookup rows for.
         :param field_ids: A list of IDs for the items.
-        :return: A list of DataFrames containing lookup rows.
+        :return: A list of dictionaries containing lookup rows.
         """
         layer_details = self.layers_filter_method(items)
         lookup_rows = []
         for item, field_id in zip(items, field_ids):
             if item in layer_details:
-                state_info = layer_details[item]
-                new_row = pd.DataFrame({
-                    f'{field}_ID': [field_id],
-                    'StateName': state_info['StateName'],
-                    'State_ID': state_info['State_ID'],
-                    'LayersNames': [item],
-                    'Scene_ID': [None],
-                    'Version': [1],
+                details = layer_details[item]
+                lookup_rows.append({
+                    f'{field}_ID': field_id,
+                    'StateName': details['StateName'],
+                    'State_ID': details['State_ID'],
+                    'LayersNames': item,
+                    'Scene_ID': None,
+                    'Version': 1,
                     'User': ''
                 })
-                lookup_rows.append(new_row)
         return lookup_rows
 
     def create_feature_code_lookup(self, field, field_id, item):
         """
-        Creates a lookup table for 'FeatureCodes' based on the extracted data.
+        Creates a lookup row for 'FeatureCodes' based on the extracted data.
         :param field: The name of the field to create a lookup table for.
         :param field_id: The ID of the field to create a lookup row for.
         :param item: The item to create a lookup row for.
-        :return: A DataFrame containing the lookup row.
+        :return: A dictionary containing the lookup row.
         """
-        if field not in self.shared_fields_dfs[field]:
-            self.shared_fields_dfs[field] = pd.DataFrame(
-                columns=[f'{field}_ID', f'{field}Names', 'JarvisFeed_ID', 'Version', 'User'])
-        new_row = pd.DataFrame(
-            {f'{field}_ID': [field_id], f'{field}Names': [item], 'JarvisFeed_ID': 1, 'Version': 1, 'User': ''})
-        return new_row
+        return {f'{field}_ID': field_id, f'{field}Names': item, 'JarvisFeed_ID': 1, 'Version': 1, 'User': ''}
 
     def create_lighting_lookup(self, field, field_id, item):
-        if field not in self.shared_fields_dfs[field]:
-            self.shared_fields_dfs[field] = pd.DataFrame(
-                columns=[f'{field}_ID', f'{field}Names', 'Scene_ID', 'Version', 'User'])
-        new_row = pd.DataFrame(
-            {f'{field}_ID': [field_id], f'{field}Names': [item], 'Scene_ID': [None], 'Version': 1, 'User': ''})
-        return new_row
+        return {f'{field}_ID': field_id, f'{field}Names': item, 'Scene_ID': None, 'Version': 1, 'User': ''}
 
     def create_exclude_lookup(self, field, field_id, item):
-        if field not in self.shared_fields_dfs[field]:
-            self.shared_fields_dfs[field] = pd.DataFrame(
-                columns=[f'Option{field}_ID', f'{field}Name', 'Scene_ID', 'Version', 'User'])
-        new_row = pd.DataFrame(
-            {f'Option{field}_ID': [field_id], f'{field}Name': [item], 'Scene_ID': [None], 'Version': 1, 'User': ''})
-        return new_row
+        return {f'Option{field}_ID': field_id, f'{field}Name': item, 'Scene_ID': None, 'Version': 1, 'User': ''}
 
     def create_include_lookup(self, field, field_id, item):
-        if field not in self.shared_fields_dfs[field]:
-            self.shared_fields_dfs[field] = pd.DataFrame(
-                columns=[f'Option{field}_ID', f'{field}Name', 'Scene_ID', 'Version', 'User'])
-        new_row = pd.DataFrame(
-            {f'Option{field}_ID': [field_id], f'{field}Name': [item], 'Scene_ID': [None], 'Version': 1, 'User': ''})
-        return new_row
+        return {f'Option{field}_ID': field_id, f'{field}Name': item, 'Scene_ID': None, 'Version': 1, 'User': ''}
 
     def create_rendered_scenes_lookup(self, field, field_id, item):
-        if field not in self.shared_fields_dfs[field]:
-            self.shared_fields_dfs[field] = pd.DataFrame(
-                columns=[f'{field}_ID', 'Department', 'Scene_ID', 'Version', 'User'])
-        new_row = pd.DataFrame(
-            {f'{field}_ID': [field_id], 'Department': [item], 'Scene_ID': [None], 'Version': 1, 'User': ''})
-        return new_row
+        return {f'{field}_ID': field_id, 'Department': item, 'Scene_ID': None, 'Version': 1, 'User': ''}
 
     def update_render_pass_table_with_references(self):
         """
         Updates the render pass table with references to shared fields.
+        All reference columns are built first and the render pass table is rebuilt once.
         """
+        reference_columns = {}
         for field in self.shared_fields:
+            column_name = f'Option{field}_ID' if field in ['Exclude', 'Include'] else f'{field}_ID'
             if field in self.render_pass_df.columns:
-                def map_value_or_list(value):
-                    if isinstance(value, (list, tuple)):
-                        return [self.field_id_maps[field].get(str(item), item) for item in value]
-                    else:
-                        return self.field_id_maps[field].get(str(value), value)
-
-                mapped_series = self.render_pass_df[field].apply(map_value_or_list)
-                self.render_pass_df[f'{field}_ID'] = mapped_series
-                self.render_pass_df.drop(field, axis=1, inplace=True)
-                self.render_pass_df.rename(columns={'Include_ID': 'OptionInclude_ID', 'Exclude_ID': 'OptionExclude_ID'},
-                                           inplace=True)
+                reference_columns[column_name] = self.map_references(self.render_pass_df[field],
+                                                                     self.field_id_maps[field])
             else:
-                self.render_pass_df[f'{field}_ID'] = [[] for _ in range(len(self.render_pass_df))]
-                self.render_pass_df.rename(columns={'Include_ID': 'OptionInclude_ID', 'Exclude_ID': 'OptionExclude_ID'},
-                                           inplace=True)
-        self.clean_and_update_render_pass()
+                reference_columns[column_name] = [[] for _ in range(len(self.render_pass_df))]
+        columns = {column: self.render_pass_df[column] for column in self.render_pass_df.columns if
+                   column not in self.shared_fields}
+        columns.update(reference_columns)
+        self.clean_and_update_render_pass(columns)
 
-    def clean_and_update_render_pass(self):
+    @staticmethod
+    def map_references(series, id_map):
+        """
+        Maps the values of a shared field column to their IDs, values without an ID are kept as they are.
+        The column is factorized, so each distinct value is looked up once and list or tuple cells are mapped
+        element by element.
+        :param series: The shared field column of the render pass table.
+        :param id_map: A dictionary mapping the string form of values to IDs.
+        :return: A Series of IDs with the same index.
+        """
+        if pd.api.types.infer_dtype(series, skipna=True) not in ('string', 'empty'):
+            is_list = series.map(lambda value: isinstance(value, (list, tuple)))
+            if is_list.any():
+                mapped_lists = series[is_list].map(lambda value: [id_map.get(str(item), item) for item in value])
+                mapped_scalars = NormalizerUtils.map_references(series[~is_list], id_map)
+                return pd.concat([mapped_scalars, mapped_lists]).reindex(series.index)
+
+        codes, uniques = pd.factorize(series)
+        mapped_uniques = np.array([id_map.get(str(item), item) for item in uniques] + [None], dtype=object)
+        values = mapped_uniques.take(codes)
+        if (codes < 0).any():
+            values = np.where(codes < 0, series.to_numpy(dtype=object), values)  # Keep None/NaN as they are
+        return pd.Series(values, index=series.index, name=series.name)
+
+    def clean_and_update_render_pass(self, columns=None):
         """
         Cleans and updates the render pass table by removing unnecessary columns and renaming others.
+        :param columns: The render pass columns as a dictionary, the current render pass table is used if None.
         """
-        columns = ['LightingState', 'OverrideFilename']
-        for item in columns:
-            if item in self.render_pass_df.columns:
-                self.render_pass_df.drop(item, axis=1, inplace=True)
-
+        if columns is None:
+            columns = {column: self.render_pass_df[column] for column in self.render_pass_df.columns}
+        removed_columns = ['LightingState', 'OverrideFilename']
         ''' Change the column name from State to BaseState in the RenderPass Table '''
-        self.render_pass_df.rename(columns={'State': 'BaseState'}, inplace=True)
-        self.render_pass_df['FeatureCodeCurrent_ID'] = None
-        self.render_pass_df['LayerCurrent_ID'] = None
-        self.render_pass_df['LightingCurrent_ID'] = None
-        self.render_pass_df['ZoneCurrent_ID'] = None
-        self.render_pass_df['RenderedScenesCurrent_ID'] = None
-        self.render_pass_df['ExcludeCurrent_ID'] = None
-        self.render_pass_df['IncludeCurrent_ID'] = None
+        columns = {('BaseState' if column == 'State' else column): values for column, values in columns.items() if
+                   column not in removed_columns}
+        current_columns = ['FeatureCodeCurrent_ID', 'LayerCurrent_ID', 'LightingCurrent_ID', 'ZoneCurrent_ID',
+                           'RenderedScenesCurrent_ID', 'ExcludeCurrent_ID', 'IncludeCurrent_ID']
+        for column in current_columns:
+            columns[column] = None
+        self.render_pass_df = pd.DataFrame(columns, index=self.render_pass_df.index)
 
     def finalize_shared_fields_dfs(self):
         """
-        Finalizes the shared fields DataFrames by concatenating accumulated rows.
+        Finalizes the shared fields DataFrames by building each lookup table from its accumulated rows.
+        With a session the rows stay in the session until it flushes them, so nothing is built here.
         """
+        if self.session is not None:
+            return
         for field in self.shared_fields:
-            valid_dfs = [df for df in self.accumulated_new_rows[field] if isinstance(df, pd.DataFrame)]
-
-            if valid_dfs:
-                accumulated_df = pd.concat(valid_dfs, ignore_index=True)
-                if field in self.shared_fields_dfs and not self.shared_fields_dfs[field].empty:
-                    if field in ['Exclude', 'Include']:
-                        self.shared_fields_dfs[f'Option{field}'] = pd.concat(
-                            [self.shared_fields_dfs[field], accumulated_df],
-                            ignore_index=True)
-                    else:
-                        self.shared_fields_dfs[field] = pd.concat([self.shared_fields_dfs[field], accumulated_df],
-                                                                  ignore_index=True)
+            lookup_builder = self.lookup_builders[field]
+            if len(lookup_builder):
+                if field in ['Exclude', 'Include']:
+                    self.shared_fields_dfs[f'Option{field}'] = lookup_builder.to_df()
                 else:
-                    if field in ['Exclude', 'Include']:
-                        self.shared_fields_dfs[f'Option{field}'] = accumulated_df
-                    else:
-                        self.shared_fields_dfs[field] = accumulated_df
+                    self.shared_fields_dfs[field] = lookup_builder.to_df()
             else:
-                if field not in self.shared_fields_dfs or self.shared_fields_dfs[field].empty:
-                    if field in ['Exclude', 'Include']:
-                        self.shared_fields_dfs[f'Option{field}'] = pd.DataFrame()
-                    self.shared_fields_dfs[field] = pd.DataFrame()
+                if field in ['Exclude', 'Include']:
+                    self.shared_fields_dfs[f'Option{field}'] = pd.DataFrame()
+                self.shared_fields_dfs[field] = pd.DataFrame()
 
     def normalize_data(self):
         """
         Normalizes the extracted data by creating lookup tables and updating the render pass table.
         """
-        self.extract_shared_fields()
-        self.update_render_pass_table_with_references()
-        self.finalize_shared_fields_dfs()
+        with metrics.span('normalize') as span:
+            span.set(rows=len(self.render_pass_df))
+            self.extract_shared_fields()
+            self.update_render_pass_table_with_references()
+            self.finalize_shared_fields_dfs()
 
     def get_normalized_dataframes(self):
         """
@@ -783,11 +1500,12 @@ class NormalizerUtils:
         return self.render_pass_df, self.shared_fields_dfs
 
     @staticmethod
-    def filter_method(table_name, unique_values):
+    @metrics.timed('lookup')
+    def filter_method(table_name, unique_values=None):
         """
         Filters a table by a given column and returns a dictionary mapping values to IDs.
         :param table_name: The name of the table to filter.
-        :param unique_values: A list of unique values to filter by.
+        :param unique_values: A list of unique values to filter by, all rows are returned if None.
         :return: A dictionary mapping values to IDs.
         """
         Base = initializer()
@@ -796,7 +1514,7 @@ class NormalizerUtils:
         try:
             if table_name in meta_data.tables:
                 table_obj = getattr(Base.classes, table_name[7:])
-                session = Session()
+                session = get_session()
                 if table_name == 'public.RenderedScenes':
                     filter_column = 'Department'
                 elif table_name in ['public.OptionExclude', 'public.OptionInclude']:
@@ -806,11 +1524,13 @@ class NormalizerUtils:
                 column_to_filter = getattr(table_obj, filter_column)
                 ID_column_name = f'{table_name[7:]}_ID'
 
-                results = session.query(table_obj).filter(column_to_filter.in_(unique_values)).all()
+                query = session.query(column_to_filter, getattr(table_obj, ID_column_name))
+                if unique_values is not None:
+                    query = query.filter(column_to_filter.in_(unique_values))
+                results = query.all()
                 session.close()
 
-                value_id_map = {getattr(result, filter_column): getattr(result, ID_column_name) for result in
-                                results}
+                value_id_map = {value: value_id for value, value_id in results}
                 return value_id_map
             else:
                 return {}
@@ -820,8 +1540,9 @@ class NormalizerUtils:
             return {}
 
     @staticmethod
+    @metrics.timed('lookup')
     def state_filter_method(assignments_list):
-        session = Session()
+        session = get_session()
         state_details_dict = {}
         try:
             Base = initializer()
@@ -859,8 +1580,9 @@ class NormalizerUtils:
         return state_details_dict
 
     @staticmethod
+    @metrics.timed('lookup')
     def layers_filter_method(layers_list):
-        session = Session()
+        session = get_session()
         layers_details_dict = {}
         try:
             Base = initializer()
@@ -869,25 +1591,177 @@ class NormalizerUtils:
                 states_table.Name,
                 states_table.State_ID,
                 states_table.Layers
-            ).filter(states_table.Layers.in_(layers_list))
+            ).filter(states_table.Layers.in_(layers_list)).order_by(states_table.Name)
 
             results = query.all()
             if not results:
                 for layer in layers_list:
                     layers_details_dict[layer] = {
-                        'StateName': [None],
-                        'State_ID': [None]
+                        'StateName': None,
+                        'State_ID': None
                     }
             else:
                 for result in results:
-                    if result.Layers not in layers_details_dict:
+                    if result.Layers not in layers_details_dict:  # A layer of several states keeps the first one
                         layers_details_dict[result.Layers] = {
-                            'StateName': [],
-                            'State_ID': [],
+                            'StateName': result.Name,
+                            'State_ID': result.State_ID
                         }
-                    layers_details_dict[result.Layers]['StateName'].append(result.Name)
-                    layers_details_dict[result.Layers]['State_ID'].append(result.State_ID)
         finally:
             session.close()
 
         return layers_details_dict
+
+
+class NormalizerSession:
+    """
+    A run-scoped normalizer state shared by all editor files of a run.
+
+    The lookup tables are loaded once into 'field_id_maps' and new lookup rows are kept in the session's RowBuilders.
+    They are loaded with one 'load_to_db' call per lookup table when 'flush' is called, or when 'batch_size' pending
+    rows are reached.
+    """
+
+    def __init__(self, batch_size=None, single_transaction=False):
+        """
+        :param batch_size: The number of pending lookup rows that triggers a flush, rows are only flushed by 'flush'
+        if None.
+        :param single_transaction: If True, the lookup tables of a flush are loaded in one transaction.
+        """
+        self.batch_size = batch_size
+        self.single_transaction = single_transaction
+        self.field_id_maps = {field: {} for field in NormalizerUtils.shared_fields}
+        self.lookup_builders = {field: RowBuilder() for field in NormalizerUtils.shared_fields}
+        self.failed = False  # A flush failed, rows of the session's files may reference missing lookup rows
+        self._lock = threading.RLock()  # Loader threads normalize and flush one at a time
+
+    def load_lookup_tables(self):
+        """
+        Loads the value to ID maps of all existing lookup tables, one query per table.
+        """
+        for field in NormalizerUtils.shared_fields:
+            self.field_id_maps[field].update(NormalizerUtils.filter_method(field))
+
+    def normalize(self, render_pass_df):
+        """
+        Normalizes the render pass data of one editor file with the session's ID maps.
+        :param render_pass_df: The DataFrame containing render pass data to normalize.
+        :return: The normalized render pass DataFrame.
+        """
+        with self._lock:
+            xml_normalizer = NormalizerUtils(render_pass_df, session=self)
+            xml_normalizer.normalize_data()
+            if self.batch_size is not None and self.pending_rows() >= self.batch_size:
+                self.flush()
+        return xml_normalizer.render_pass_df
+
+    def pending_rows(self):
+        return sum(len(lookup_builder) for lookup_builder in self.lookup_builders.values())
+
+    def flush(self):
+        """
+        Loads the pending lookup rows to the database and starts new RowBuilders.
+        The ID maps are kept, so later files still reference the flushed rows.
+        :return: True if the lookup rows of every flush of the session were loaded.
+        """
+        lookup_dfs = {}
+        with self._lock:
+            for field, lookup_builder in self.lookup_builders.items():
+                if len(lookup_builder):
+                    table_name = f'Option{field}' if field in ['Exclude', 'Include'] else field
+                    lookup_dfs[table_name] = lookup_builder.to_df()
+                self.lookup_builders[field] = RowBuilder()
+        if lookup_dfs and not BaseXMLParser.load_to_db(lookup_dfs, ignore_conflicts=id_strategy == 'deterministic',
+                                                       single_transaction=self.single_transaction):
+            self.failed = True
+        return not self.failed
+
+
+class IngestionManifest:
+    """
+    Keeps track of the ingested XML files in the 'IngestionManifest' table.
+
+    Each file is stored with its size, modification time, content hash and the Project_ID its rows belong to, so
+    unchanged files can be skipped and the rows of changed files can be replaced.
+    """
+    table_name = 'IngestionManifest'
+
+    def __init__(self):
+        self.entries = {}
+
+    def load(self):
+        """
+        Creates the manifest table if it doesn't exist and loads all entries with one query.
+        """
+        with get_engine().connect() as conn:
+            trans = conn.begin()
+            conn.execute(text(f'CREATE TABLE IF NOT EXISTS "public"."{self.table_name}" ('
+                              '"Path" TEXT PRIMARY KEY, "Size" BIGINT, "MTime" BIGINT, "ContentHash" TEXT, '
+                              '"Project_ID" TEXT, "IngestedAt" TIMESTAMP);'))
+            trans.commit()
+            rows = conn.execute(text(f'SELECT * FROM "public"."{self.table_name}";')).mappings().all()
+        reflection_registry.invalidate()
+        table_schema_cache.invalidate()
+        self.entries = {row['Path']: dict(row) for row in rows}
+
+    @staticmethod
+    def file_key(path):
+        return os.path.normpath(path)
+
+    @staticmethod
+    def content_hash(path):
+        """
+        Computes the SHA-256 hash of the file content, reading it in chunks.
+        """
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def get_entry(self, path):
+        return self.entries.get(self.file_key(path))
+
+    def check_file(self, path):
+        """
+        Checks whether the file changed since it was ingested. The content is hashed only if the size or the
+        modification time differs from the manifest entry.
+        :param path: The path of the XML file.
+        :return: A tuple of (unchanged, fingerprint), the fingerprint is a dictionary of the manifest columns.
+        """
+        stat = os.stat(path)
+        fingerprint = {'Path': self.file_key(path), 'Size': stat.st_size, 'MTime': stat.st_mtime_ns,
+                       'ContentHash': None}
+        entry = self.get_entry(path)
+        if entry is not None and entry['Size'] == stat.st_size and entry['MTime'] == stat.st_mtime_ns:
+            fingerprint['ContentHash'] = entry['ContentHash']
+            return True, fingerprint
+
+        fingerprint['ContentHash'] = self.content_hash(path)
+        unchanged = entry is not None and entry['ContentHash'] == fingerprint['ContentHash']
+        if unchanged:
+            self.record(fingerprint, entry['Project_ID'])  # Only the modification time changed
+        return unchanged, fingerprint
+
+    def record(self, fingerprint, project_id):
+        """
+        Inserts or updates the manifest entry of an ingested file.
+        :param fingerprint: The fingerprint returned by 'check_file'.
+        :param project_id: The ID of the project the file's rows belong to.
+        """
+        entry = dict(fingerprint, Project_ID=str(project_id), IngestedAt=datetime.now())
+        with get_engine().connect() as conn:
+            trans = conn.begin()
+            try:
+                conn.execute(text(
+                    f'INSERT INTO "public"."{self.table_name}" '
+                    '("Path", "Size", "MTime", "ContentHash", "Project_ID", "IngestedAt") '
+                    'VALUES (:Path, :Size, :MTime, :ContentHash, :Project_ID, :IngestedAt) '
+                    'ON CONFLICT ("Path") DO UPDATE SET "Size" = EXCLUDED."Size", "MTime" = EXCLUDED."MTime", '
+                    '"ContentHash" = EXCLUDED."ContentHash", "Project_ID" = EXCLUDED."Project_ID", '
+                    '"IngestedAt" = EXCLUDED."IngestedAt";'), entry)
+                trans.commit()
+                self.entries[entry['Path']] = entry
+            except Exception as e:
+                print("Manifest Error is:", e)
+                trans.rollback()
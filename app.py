@@ -1,40 +1,280 @@
 import xml.etree.ElementTree as ET
 from XML_parser import *
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import argparse
+import queue
+import threading
 import time
+import traceback
 
 
-def process_xml_files(xml_paths, parser_class):
+def process_xml_files(xml_paths, parser_class, streaming=False, workers=1, state_index=None, manifest=None,
+                      force=False, normalizer_session=None, loader_threads=0, queue_size=4, single_transaction=False):
     """
     This function is used to process all xml files in the given directory.
+    Files are parsed and extracted in a process pool when workers > 1. Project IDs are assigned in the main process,
+    in the order of xml_paths. Data is loaded in the main process in the same order, or by loader threads when
+    loader_threads > 0, so parsing the next files overlaps with loading the previous ones.
     :param xml_paths: list of xml file paths
     :param parser_class: class of the parser
+    :param streaming: parse editor passes with iterparse instead of loading the whole tree
+    :param workers: number of processes used for parsing and extraction
+    :param state_index: (project id, state name) to State_ID dictionary, state files add their states to it and
+    editor files use it for RenderPass.State_ID
+    :param manifest: IngestionManifest object, unchanged files are skipped and loaded files are recorded in it. The
+    rows of a file that is in the manifest are replaced in the transaction that loads its new rows
+    :param force: process the files even if they are unchanged
+    :param normalizer_session: NormalizerSession shared by the editor files, its lookup rows are flushed at the end,
+    also when a load failed. The files are recorded in the manifest after the flush, once their lookup rows are loaded
+    :param loader_threads: number of threads loading the extracted files to the database, 0 loads them in order
+    in the main process
+    :param queue_size: number of extracted files waiting for a loader thread, extraction waits when it is full
+    :param single_transaction: load the dataframes of each file in one transaction with the cached table schema
     :return: None
     """
     print(f"All parsing processes are started: {datetime.now().strftime('%H:%M:%S')}")
-    for i, path in enumerate(xml_paths, start=1):
-        print(f"PATH {i}->", path)
+    fingerprints = {}
+    unflushed_files = []  # Loaded files whose lookup rows are still in the normalizer session
+    if manifest is not None:
+        xml_paths, fingerprints = select_changed_files(xml_paths, manifest, force)
+
+    def extracted_files():
+        for path, project_id, dfs, metric_records in extract_xml_files(xml_paths, parser_class, streaming, workers,
+                                                                       state_index, manifest):
+            metrics.merge(metric_records)
+            if state_index is not None and 'State' in dfs:
+                EditorXMLParser.build_state_index(dfs['State'], state_index)
+            yield path, project_id, dfs
+
+    def load_file(path, project_id, dfs):
+        with metrics.span('file', file=path):
+            replaced_rows = None
+            if manifest is not None and manifest.get_entry(path) is not None:
+                replaced_rows = (project_id, parser_class.file_type)
+            loaded = load_extracted_data(path, dfs, normalizer_session, single_transaction, replaced_rows)
+            if manifest is None:
+                return
+            if not loaded:
+                print("File is not recorded in the manifest, it is loaded again by the next run:", path)
+            elif normalizer_session is not None:
+                unflushed_files.append((path, project_id))
+            else:
+                manifest.record(fingerprints[path], project_id)
+
+    try:
+        if loader_threads > 0:
+            load_pipelined(extracted_files(), load_file, loader_threads, queue_size)
+        else:
+            for path, project_id, dfs in extracted_files():
+                load_file(path, project_id, dfs)
+    finally:
+        ''' The lookup rows of the loaded files are flushed even if another file failed '''
+        if normalizer_session is not None:
+            flushed = normalizer_session.flush()
+            for path, project_id in unflushed_files:
+                if flushed:
+                    manifest.record(fingerprints[path], project_id)
+                else:
+                    print("Lookup rows are not loaded, the file is loaded again by the next run:", path)
+
+
+def load_pipelined(extracted_files, load_file, loader_threads, queue_size):
+    """
+    This function is used to load the extracted files with loader threads while the next files are extracted.
+    The queue between extraction and the loader threads is bounded, so at most queue_size extracted files wait in
+    memory. The loader threads use the pooled connections of the shared engine.
+    :param extracted_files: iterable of (path, project id, dataframes) tuples
+    :param load_file: function that loads one extracted file
+    :param loader_threads: number of loader threads
+    :param queue_size: maximum number of extracted files in the queue
+    :return: None
+    """
+    file_queue = queue.Queue(maxsize=queue_size)
+    errors = []
+
+    def loader():
+        while True:
+            extracted_file = file_queue.get()
+            if extracted_file is None:
+                return
+            try:
+                load_file(*extracted_file)
+            except Exception as e:
+                print("Loader Error is:", e)
+                traceback.print_exc()
+                errors.append(e)
+
+    threads = [threading.Thread(target=loader, name=f'loader-{i}') for i in range(loader_threads)]
+    for thread in threads:
+        thread.start()
+    try:
+        for extracted_file in extracted_files:
+            file_queue.put(extracted_file)  # Blocks while the queue is full
+    finally:
+        for _ in threads:
+            file_queue.put(None)
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+
+
+def select_changed_files(xml_paths, manifest, force=False):
+    """
+    This function is used to select the xml files that changed since they were ingested.
+    :param xml_paths: list of xml file paths
+    :param manifest: IngestionManifest object
+    :param force: select the files even if they are unchanged
+    :return: tuple of (changed paths, dictionary of path to fingerprint)
+    """
+    changed_paths = []
+    fingerprints = {}
+    for path in xml_paths:
+        unchanged, fingerprint = manifest.check_file(path)
+        if unchanged and not force:
+            print("Skipping unchanged file:", path)
+            continue
+        changed_paths.append(path)
+        fingerprints[path] = fingerprint
+    return changed_paths, fingerprints
+
+
+def extract_xml_files(xml_paths, parser_class, streaming=False, workers=1, state_index=None, manifest=None):
+    """
+    This function is used to parse and extract the given xml files, in order.
+    :param xml_paths: list of xml file paths
+    :param parser_class: class of the parser
+    :param streaming: parse editor passes with iterparse instead of loading the whole tree
+    :param workers: number of processes used for parsing and extraction
+    :param state_index: (project id, state name) to State_ID dictionary for editor files
+    :param manifest: IngestionManifest object, the project ids of ingested files are taken from it
+    :return: generator of (path, project id, dataframes, metric records) tuples
+    """
+    jobs = ((path, parser_class, get_or_create_project_id(i, path, manifest), streaming, state_index)
+            for i, path in enumerate(xml_paths, start=1))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(get_id_strategy(), metrics.enabled)) as executor:
+            """ Jobs are submitted as results are taken, so finished results don't pile up when loading is slow """
+            pending = deque()
+            for job in jobs:
+                pending.append(executor.submit(extract_xml_file, job))
+                if len(pending) >= 2 * workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+    else:
+        yield from map(extract_xml_file, jobs)
+
+
+def get_or_create_project_id(index, path, manifest=None):
+    """
+    This function is used to get the project id of the given xml file, the project is created if it doesn't exist.
+    If the file is in the manifest, its project id is reused, the rows it loaded before are replaced when it is loaded.
+    :param index: position of the xml file in the run
+    :param path: path of the xml file
+    :param manifest: IngestionManifest object
+    :return: project id
+    """
+    print(f"PATH {index}->", path)
+    with metrics.span('project', file=path):
+        entry = manifest.get_entry(path) if manifest is not None else None
+        if entry is not None:
+            return entry['Project_ID']
         project_name = create_project_name(path)
-        tree = ET.parse(path)
-        root = tree.getroot()
-        xml_parser = parser_class(root, path)
+        if get_id_strategy() == 'deterministic':
+            """ The project id is derived from the name, the project is inserted if it doesn't exist """
+            return BaseXMLParser.create_project_df(project_name)
         project_id = BaseXMLParser.projects_filter_method(project_name)
         """ If project name doesn't exist, create it """
         if project_id is None:
-            xml_parser.create_project_df(project_name)
+            BaseXMLParser.create_project_df(project_name)
             project_id = BaseXMLParser.projects_filter_method(project_name)
+        return project_id
+
+
+def extract_xml_file(job):
+    """
+    This function is used to parse one xml file and extract its data. It doesn't use the database, so it can run
+    in a worker process.
+    :param job: tuple of (path, parser_class, project_id, streaming, state_index)
+    :return: tuple of (path, project id, dataframes, metric records), the metric records are the spans recorded
+    since the last job, so spans of worker processes reach the main process
+    """
+    path, parser_class, project_id, streaming, state_index = job
+    with metrics.span('parse', file=path) as span:
+        span.set(bytes=os.path.getsize(path))
+        xml_parser = create_xml_parser(path, parser_class, streaming, state_index)
+    with metrics.span('extract', file=path) as span:
         dfs = xml_parser.extract_all_data_to_df(project_id)
-        if 'EDITOR' in path:
-            xml_normalizer = NormalizerUtils(dfs['RenderPass'])
-            print("Normalize Start", datetime.now().strftime('%H:%M:%S'))
-            xml_normalizer.normalize_data()
-            print("Normalize end", datetime.now().strftime('%H:%M:%S'))
-            normalized_render_pass_df, normalized_common_fields_df = xml_normalizer.get_normalized_dataframes()
-            render_pass_dict = {'RenderPass': normalized_render_pass_df}
-            xml_parser.load_to_db(render_pass_dict)
-            xml_parser.load_to_db(normalized_common_fields_df)
-            dfs = {key: value for key, value in dfs.items() if key != 'RenderPass'}
-        xml_parser.load_to_db(dfs)
+        span.set(rows=sum(len(df) for df in dfs.values()))
+    return path, project_id, dfs, metrics.drain()
+
+
+def load_extracted_data(path, dfs, normalizer_session=None, single_transaction=False, replaced_rows=None):
+    """
+    This function is used to normalize the extracted data of editor files and load all dataframes to the database.
+    :param path: path of the xml file
+    :param dfs: dataframes extracted from the xml file
+    :param normalizer_session: NormalizerSession that keeps the lookup rows, a per-file normalizer is used if None
+    :param single_transaction: load the dataframes of the file in one transaction with the cached table schema
+    :param replaced_rows: tuple of (project id, file type) of a file that was loaded before, its previous rows are
+    deleted in the transaction that loads the dataframes
+    :return: True if all dataframes were loaded
+    """
+    lookups_loaded = True
+    if 'EDITOR' in path and normalizer_session is not None:
+        print("Normalize Start", datetime.now().strftime('%H:%M:%S'))
+        normalized_render_pass_df = normalizer_session.normalize(dfs['RenderPass'])
+        print("Normalize end", datetime.now().strftime('%H:%M:%S'))
+        dfs = dict(dfs, RenderPass=normalized_render_pass_df)
+    elif 'EDITOR' in path:
+        xml_normalizer = NormalizerUtils(dfs['RenderPass'])
+        print("Normalize Start", datetime.now().strftime('%H:%M:%S'))
+        xml_normalizer.normalize_data()
+        print("Normalize end", datetime.now().strftime('%H:%M:%S'))
+        normalized_render_pass_df, normalized_common_fields_df = xml_normalizer.get_normalized_dataframes()
+        """ Lookup rows are shared by the files, they are loaded on their own """
+        lookups_loaded = BaseXMLParser.load_to_db(normalized_common_fields_df,
+                                                  ignore_conflicts=get_id_strategy() == 'deterministic',
+                                                  single_transaction=single_transaction)
+        dfs = dict(dfs, RenderPass=normalized_render_pass_df)
+    loaded = BaseXMLParser.load_to_db(dfs, single_transaction=single_transaction, replaced_rows=replaced_rows)
+    return loaded and lookups_loaded
+
+
+def init_worker(id_strategy='random', metrics_enabled=False):
+    """
+    This function is used to initialize worker processes. The engine inherited from the parent process is dropped
+    by the engine provider after the fork, a worker creates its own pool when it first uses the database.
+    :param id_strategy: ID strategy of the main process
+    :param metrics_enabled: record metric spans in the worker
+    :return: None
+    """
+    set_id_strategy(id_strategy)
+    metrics.drain()  # Spans inherited from the main process are already there
+    if metrics_enabled:
+        metrics.enable()
+
+
+def create_xml_parser(path, parser_class, streaming=False, state_index=None):
+    """
+    This function is used to create the parser object for the given xml file.
+    :param path: path of the xml file
+    :param parser_class: class of the parser
+    :param streaming: if True, editor files are not parsed here; the parser streams them during extraction
+    :param state_index: (project id, state name) to State_ID dictionary for editor files
+    :return: parser object
+    """
+    if issubclass(parser_class, EditorXMLParser):
+        if streaming:
+            return parser_class(None, path, streaming=True, state_index=state_index)
+        return parser_class(ET.parse(path).getroot(), path, state_index=state_index)
+    tree = ET.parse(path)
+    root = tree.getroot()
+    return parser_class(root, path)
 
 
 def create_project_name(path):
@@ -59,36 +299,101 @@ def get_xml_files_from_directory(directory):
     return [os.path.join(directory, file) for file in os.listdir(directory) if file.endswith('.xml')]
 
 
+def parse_arguments():
+    """
+    This function is used to parse the command line arguments.
+    :return: parsed arguments
+    """
+    parser = argparse.ArgumentParser(description='Parse Editor and State XML files and load them into the database.')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Stream editor passes with iterparse to keep memory flat on large files.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes used to parse and extract xml files (default: 1).')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Keep the existing tables and only ingest xml files that changed since the last run.')
+    parser.add_argument('--id-strategy', choices=ID_STRATEGIES, default='random',
+                        help='random: UUIDv4 IDs; deterministic: UUIDv5 IDs derived from natural keys, so projects and '
+                             'lookup rows are deduplicated without querying the database (default: random).')
+    parser.add_argument('--single-transaction', action='store_true',
+                        help='Load all tables of a file in one transaction, with cached table columns and primary keys '
+                             'added when the tables are created.')
+    parser.add_argument('--metrics', default=None,
+                        help='Record the duration, rows, bytes and database round trips of every stage and write them '
+                             'to this file.')
+    parser.add_argument('--metrics-format', choices=['jsonl', 'prometheus'], default='jsonl',
+                        help='Format of the metrics file: JSON lines or Prometheus text format (default: jsonl).')
+    parser.add_argument('--loader-threads', type=int, default=0,
+                        help='Number of threads loading extracted files to the database while the next files are '
+                             'parsed (default: 0, files are parsed and loaded one after the other).')
+    parser.add_argument('--queue-size', type=int, default=4,
+                        help='Maximum number of extracted files waiting for a loader thread (default: 4).')
+    parser.add_argument('--lookup-batch-size', type=int, default=None,
+                        help='Load the new lookup rows every N rows instead of once after all editor files.')
+    parser.add_argument('--drop-jarvis-description', action='store_true',
+                        help='Drop the Description column of the JarvisSettings table after the load.')
+    return parser.parse_args()
+
+
 def main():
     """
     This function is used to start the parsing process.
     :return: None
     """
+    args = parse_arguments()
+    set_id_strategy(args.id_strategy)
+    if args.metrics:
+        metrics.enable()
     editor_directory = 'EDITORS'
     state_directory = 'STATES'
 
     ''' Print existing tables from database '''
     print("Check If there are any existing tables:")
     BaseXMLParser.print_exist_tables()
-    ''' Delete exist tables from database '''
-    BaseXMLParser.delete_exist_tables()
+    if not args.incremental:
+        ''' Delete exist tables from database '''
+        BaseXMLParser.delete_exist_tables()
+    """ Create the declared tables and indexes """
+    BaseXMLParser.bootstrap_schema()
+    """ Load the fingerprints of the ingested xml files """
+    manifest = IngestionManifest()
+    manifest.load()
     """ Get all xml files from given directory """
     state_paths = get_xml_files_from_directory(state_directory)
     editor_paths = get_xml_files_from_directory(editor_directory)
     start_time = time.time()
     """ Process xml files """
-    process_xml_files(state_paths, StateXMLParser)
-    process_xml_files(editor_paths, EditorXMLParser)
+    state_index = {}  # (Project_ID, state name) to State_IDs, filled by the state files for RenderPass.State_ID
+    """ The state tables are removed at the end of a full run, an incremental run after it has to reload them """
+    force_states = args.incremental and not reflection_registry.has_table('State')
+    process_xml_files(state_paths, StateXMLParser, workers=args.workers, state_index=state_index,
+                      manifest=manifest, force=force_states, loader_threads=args.loader_threads,
+                      queue_size=args.queue_size, single_transaction=args.single_transaction)
+    if args.incremental:
+        """ Unchanged state files are skipped, so the index is read from the "State" table """
+        state_index = EditorXMLParser.state_index_filter_method()
+    """ The lookup tables are loaded once and shared by all editor files """
+    normalizer_session = NormalizerSession(batch_size=args.lookup_batch_size,
+                                           single_transaction=args.single_transaction)
+    normalizer_session.load_lookup_tables()
+    process_xml_files(editor_paths, EditorXMLParser, streaming=args.streaming, workers=args.workers,
+                      state_index=state_index, manifest=manifest, normalizer_session=normalizer_session,
+                      loader_threads=args.loader_threads, queue_size=args.queue_size,
+                      single_transaction=args.single_transaction)
     end_time = time.time()
     total_time = end_time - start_time
     print(f"All parsing processes are done time: {datetime.now().strftime('%H:%M:%S')}.")
     print(f"Total Time: {total_time / 60} min")
-    ''' Remove "State", "Zone", "StateSettings" tables from database '''
-    BaseXMLParser.delete_state_and_zone_table()
-    ''' Remove "Description" from jarvis_settings table '''
-    # BaseXMLParser.modify_jarvis_settings_table() # If you want to remove description column from jarvis_settings table
+    if not args.incremental:
+        ''' Remove "State", "Zone", "StateSettings" tables from database '''
+        BaseXMLParser.delete_state_and_zone_table()
+    if args.drop_jarvis_description:
+        ''' Remove "Description" from jarvis_settings table '''
+        BaseXMLParser.modify_jarvis_settings_table()
     """ Update Project Names table from database """
     BaseXMLParser.update_project_names_with_deadline_outputs()
+    if args.metrics:
+        metrics.write(args.metrics, args.metrics_format)
+        print(f"Metrics are written to {args.metrics}")
 
 
 if __name__ == '__main__':
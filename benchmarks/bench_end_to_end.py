@@ -0,0 +1,147 @@
+"""
+End-to-end benchmark of the ingestion on synthetic data, see 'benchmarks.generate_xml'.
+The files are generated, all existing tables of the database in the .env file are dropped, and the State and Editor
+files are ingested like 'app.py' does. The time of every stage is summed over the files:
+
+    project    getting or creating the project of a file
+    parse      parsing the XML file (in streaming mode the passes are parsed in 'extract')
+    extract    extracting the DataFrames
+    normalize  loading the lookup tables and normalizing the RenderPass frames
+    load       loading the DataFrames and the lookup rows to the database
+
+The result of each run is appended as one JSON line to --results, so runs of different versions can be compared.
+
+    python -m benchmarks.bench_end_to_end --editors 20 --linking-records 50 --results bench_results.jsonl
+"""
+from XML_parser import BaseXMLParser, EditorXMLParser, NormalizerSession, StateXMLParser, set_id_strategy, \
+    ID_STRATEGIES
+from app import create_xml_parser, get_or_create_project_id
+from benchmarks.generate_xml import add_generator_arguments, generate
+from contextlib import contextmanager
+from datetime import datetime
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+
+STAGES = ['project', 'parse', 'extract', 'normalize', 'load']
+
+
+class StageTimer:
+    """
+    Sums the elapsed seconds of each stage.
+    """
+
+    def __init__(self):
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+
+
+def ingest_file(index, path, parser_class, args, timer, row_counts, state_index, normalizer_session=None):
+    """
+    Ingests one XML file and adds the row counts of its DataFrames to row_counts.
+    """
+    with timer.stage('project'):
+        project_id = get_or_create_project_id(index, path)
+    with timer.stage('parse'):
+        xml_parser = create_xml_parser(path, parser_class, args.streaming, state_index)
+    with timer.stage('extract'):
+        dfs = xml_parser.extract_all_data_to_df(project_id)
+    if 'State' in dfs:
+        EditorXMLParser.build_state_index(dfs['State'], state_index)
+    if normalizer_session is not None:
+        with timer.stage('normalize'):
+            dfs['RenderPass'] = normalizer_session.normalize(dfs['RenderPass'])
+    with timer.stage('load'):
+        BaseXMLParser.load_to_db(dfs)
+    for table_name, df in dfs.items():
+        row_counts[table_name] = row_counts.get(table_name, 0) + len(df)
+
+
+def git_commit():
+    """
+    Returns the current git commit of the repository, or None outside of a git checkout.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    """
+    Generates the data set, ingests it and returns the result of the run as a dictionary.
+    """
+    if not args.skip_generate:
+        generate(args)
+    os.chdir(args.output)  # Project names are created from the 'EDITORS/...' and 'STATES/...' relative paths
+    state_paths = sorted(os.path.join('STATES', file) for file in os.listdir('STATES') if file.endswith('.xml'))
+    editor_paths = sorted(os.path.join('EDITORS', file) for file in os.listdir('EDITORS') if file.endswith('.xml'))
+
+    set_id_strategy(args.id_strategy)
+    BaseXMLParser.delete_exist_tables()
+    BaseXMLParser.bootstrap_schema()
+    timer = StageTimer()
+    row_counts = {}
+    state_index = {}
+    start = time.perf_counter()
+    for i, path in enumerate(state_paths, start=1):
+        ingest_file(i, path, StateXMLParser, args, timer, row_counts, state_index)
+    normalizer_session = NormalizerSession(batch_size=args.lookup_batch_size)
+    with timer.stage('normalize'):
+        normalizer_session.load_lookup_tables()
+    for i, path in enumerate(editor_paths, start=1):
+        ingest_file(i, path, EditorXMLParser, args, timer, row_counts, state_index, normalizer_session)
+    with timer.stage('load'):
+        normalizer_session.flush()
+    total_seconds = time.perf_counter() - start
+
+    return {
+        'benchmark': 'end_to_end',
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'parameters': {key: value for key, value in vars(args).items() if key not in ['output', 'results']},
+        'files': {'state': len(state_paths), 'editor': len(editor_paths)},
+        'rows': row_counts,
+        'stages': {stage: round(seconds, 4) for stage, seconds in timer.seconds.items()},
+        'total_seconds': round(total_seconds, 4),
+        'passes_per_second': round(row_counts.get('RenderPass', 0) / total_seconds, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the ingestion stages on synthetic XML files.')
+    add_generator_arguments(parser)
+    parser.add_argument('--skip-generate', action='store_true', help='Use the files already in --output.')
+    parser.add_argument('--streaming', action='store_true', help='Parse the Editor files with iterparse.')
+    parser.add_argument('--id-strategy', choices=ID_STRATEGIES, default='random')
+    parser.add_argument('--lookup-batch-size', type=int, default=None)
+    parser.add_argument('--results', default='bench_results.jsonl', help='JSON lines file the result is appended to.')
+    args = parser.parse_args()
+    results_path = os.path.abspath(args.results)
+
+    result = run(args)
+    with open(results_path, 'a', encoding='utf-8') as file:
+        file.write(json.dumps(result) + '\n')
+
+    print(f"{'stage':>10} {'seconds':>10}")
+    for stage, seconds in result['stages'].items():
+        print(f"{stage:>10} {seconds:>10.3f}")
+    print(f"{'total':>10} {result['total_seconds']:>10.3f}  ({result['passes_per_second']:.0f} passes/s)")
+    print(f"Result appended to {results_path}")
+
+
+if __name__ == '__main__':
+    main()
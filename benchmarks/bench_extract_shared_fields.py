@@ -0,0 +1,94 @@
+"""
+Regression benchmark of NormalizerUtils.extract_shared_fields with many distinct 'FeatureCodes' values.
+The database lookup is replaced by an empty map. By default the lookup rows are not built, so only the ID assignment
+is timed; --with-lookups also builds the 'FeatureCodes' lookup table.
+The previous list-index implementation is quadratic, it only runs up to --reference-limit distinct values.
+
+    python -m benchmarks.bench_extract_shared_fields --distinct 10000 100000 1000000 [--with-lookups]
+"""
+from XML_parser import NormalizerUtils
+
+import argparse
+import pandas as pd
+import time
+import uuid
+
+
+class OfflineNormalizer(NormalizerUtils):
+    """
+    NormalizerUtils without database access.
+    """
+
+    @staticmethod
+    def filter_method(table_name, unique_values):
+        return {}
+
+
+class IdOnlyNormalizer(OfflineNormalizer):
+    """
+    OfflineNormalizer without lookup-row creation.
+    """
+
+    def make_lookup_tables(self, field, items_not_in_map, field_ids):
+        pass
+
+
+def list_index_extract(normalizer):
+    """
+    The previous implementation of the ID assignment with list membership and list.index.
+    """
+    for field in normalizer.shared_fields:
+        if field in normalizer.render_pass_df.columns:
+            unique_items = normalizer.render_pass_df[field].dropna().unique().tolist()
+            value_id_map = normalizer.filter_method(field, unique_items)
+            items_not_in_map = [item for item in unique_items if
+                                str(item) not in value_id_map and str(item) not in normalizer.field_id_maps[field]]
+            field_ids = [str(uuid.uuid4()) for _ in items_not_in_map]
+            for item in unique_items:
+                if str(item) in value_id_map:
+                    normalizer.field_id_maps[field][str(item)] = value_id_map[str(item)]
+                elif str(item) in items_not_in_map:
+                    index = items_not_in_map.index(str(item))
+                    normalizer.field_id_maps[field][str(item)] = field_ids[index]
+
+
+def make_render_pass_df(distinct):
+    """
+    Creates a RenderPass frame with the given number of distinct 'FeatureCodes', each value used twice.
+    """
+    values = [f'(FC{i:07d}, FC{i + 1:07d})' for i in range(distinct)]
+    return pd.DataFrame({'FeatureCodes': values + values + [None]})
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the shared field ID assignment.')
+    parser.add_argument('--distinct', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--reference-limit', type=int, default=10000)
+    parser.add_argument('--with-lookups', action='store_true', help='Also build the lookup table.')
+    args = parser.parse_args()
+    normalizer_class = OfflineNormalizer if args.with_lookups else IdOnlyNormalizer
+
+    print(f"{'distinct':>10} {'hash s':>10} {'list-index s':>13}")
+    for distinct in args.distinct:
+        render_pass_df = make_render_pass_df(distinct)
+
+        normalizer = normalizer_class(render_pass_df)
+        start = time.perf_counter()
+        normalizer.extract_shared_fields()
+        if args.with_lookups:
+            normalizer.finalize_shared_fields_dfs()
+        hash_time = time.perf_counter() - start
+        assert len(normalizer.field_id_maps['FeatureCodes']) == distinct
+
+        reference = '-'
+        if distinct <= args.reference_limit:
+            normalizer = IdOnlyNormalizer(render_pass_df)
+            start = time.perf_counter()
+            list_index_extract(normalizer)
+            reference = f'{time.perf_counter() - start:.3f}'
+
+        print(f"{distinct:>10} {hash_time:>10.3f} {reference:>13}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Peak memory of the extraction of the State and Editor files, with the column stores of the parsers ('RowBuilder')
+against the previous lists of per-row dictionaries, which are kept here as the reference. The peak is measured with
+tracemalloc from the call of 'extract_all_data_to_df' until it returns, so the parsed tree is not counted unless the
+Editor files are streamed. No database is needed, the state index is built from the State files.
+
+    python -m benchmarks.bench_extraction_memory --editors 3 --linking-records 500
+"""
+from XML_parser import EditorXMLParser, StateXMLParser, set_id_strategy, ID_STRATEGIES
+from app import create_xml_parser
+from benchmarks.bench_end_to_end import git_commit
+from benchmarks.generate_xml import add_generator_arguments, generate
+from datetime import datetime
+
+import argparse
+import json
+import os
+import pandas as pd
+import time
+import tracemalloc
+import uuid
+
+
+class DictRows(list):
+    """
+    The previous row store: a list of per-row dictionaries, converted with 'pd.DataFrame(rows)'.
+    """
+
+    def to_df(self):
+        return pd.DataFrame(self)
+
+
+class DictRowsEditorXMLParser(EditorXMLParser):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.linking_record_rows = DictRows()
+        self.render_pass_rows = DictRows()
+
+
+class DictRowsStateXMLParser(StateXMLParser):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.states_settings_rows = DictRows()
+        self.state_rows = DictRows()
+        self.zone_rows = DictRows()
+
+
+def measure(path, parser_class, streaming, state_index):
+    """
+    Extracts a file and returns a tuple of (peak MB, seconds, DataFrames).
+    """
+    xml_parser = create_xml_parser(path, parser_class, streaming, state_index)
+    tracemalloc.start()
+    start = time.perf_counter()
+    dfs = xml_parser.extract_all_data_to_df(str(uuid.uuid4()))
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1e6, seconds, dfs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the peak extraction memory of the row stores.')
+    add_generator_arguments(parser)
+    parser.add_argument('--skip-generate', action='store_true', help='Use the files already in --output.')
+    parser.add_argument('--streaming', action='store_true', help='Parse the Editor files with iterparse.')
+    parser.add_argument('--id-strategy', choices=ID_STRATEGIES, default='random')
+    parser.add_argument('--results', default=None, help='JSON lines file the result is appended to.')
+    args = parser.parse_args()
+
+    if not args.skip_generate:
+        generate(args)
+    set_id_strategy(args.id_strategy)
+    state_paths = sorted(os.path.join(args.output, 'STATES', file)
+                         for file in os.listdir(os.path.join(args.output, 'STATES')) if file.endswith('.xml'))
+    editor_paths = sorted(os.path.join(args.output, 'EDITORS', file)
+                          for file in os.listdir(os.path.join(args.output, 'EDITORS')) if file.endswith('.xml'))
+
+    state_index = {}
+    files = []
+    for path in state_paths + editor_paths:
+        is_editor = path in editor_paths
+        result = {'file': os.path.basename(path)}
+        for name, parser_class in [('dicts', DictRowsEditorXMLParser if is_editor else DictRowsStateXMLParser),
+                                   ('columns', EditorXMLParser if is_editor else StateXMLParser)]:
+            peak, seconds, dfs = measure(path, parser_class, args.streaming and is_editor, state_index)
+            result[name] = {'peak_mb': round(peak, 3), 'seconds': round(seconds, 4)}
+        result['rows'] = sum(len(df) for df in dfs.values())
+        if 'State' in dfs:
+            EditorXMLParser.build_state_index(dfs['State'], state_index)
+        files.append(result)
+
+    print(f"{'file':<28} {'rows':>8} {'dicts MB':>9} {'columns MB':>11} {'ratio':>6} {'dicts s':>8} {'columns s':>10}")
+    for result in files:
+        dicts, columns = result['dicts'], result['columns']
+        print(f"{result['file']:<28} {result['rows']:>8} {dicts['peak_mb']:>9.2f} {columns['peak_mb']:>11.2f} "
+              f"{dicts['peak_mb'] / columns['peak_mb']:>5.1f}x {dicts['seconds']:>8.3f} {columns['seconds']:>10.3f}")
+
+    if args.results:
+        results_path = os.path.abspath(args.results)
+        with open(results_path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps({'benchmark': 'extraction_memory', 'commit': git_commit(),
+                                   'timestamp': datetime.now().isoformat(timespec='seconds'),
+                                   'parameters': {key: value for key, value in vars(args).items() if key != 'results'},
+                                   'files': files}) + '\n')
+        print(f"Result appended to {results_path}")
+
+
+if __name__ == '__main__':
+    main()
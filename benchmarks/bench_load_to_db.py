@@ -0,0 +1,69 @@
+"""
+Benchmark of the 'to_sql' (INSERT) and COPY paths of BaseXMLParser.load_to_db on a local PostgreSQL.
+
+Run from the repository root, the database credentials are read from the .env file:
+
+    python -m benchmarks.bench_load_to_db --rows 10000 100000
+"""
+from XML_parser import BaseXMLParser, get_engine
+from sqlalchemy import text
+
+import argparse
+import pandas as pd
+import time
+import uuid
+
+
+def make_render_pass_df(rows):
+    """
+    Creates a RenderPass-like DataFrame with text, UUID and list-valued columns like the normalizer produces.
+    :param rows: number of rows
+    :return: DataFrame
+    """
+    project_id = str(uuid.uuid4())
+    return pd.DataFrame({
+        'Name': [f'pass_{i}' for i in range(rows)],
+        'RenderPass_ID': [str(uuid.uuid4()) for _ in range(rows)],
+        'PassType': ['BasePass' if i % 4 == 0 else 'OptionPass' for i in range(rows)],
+        'BasePass_ID': [None if i % 4 == 0 else str(uuid.uuid4()) for i in range(rows)],
+        'Project_ID': [project_id] * rows,
+        'BaseState': [f'State_{i % 50}' for i in range(rows)],
+        'FeatureCodes_ID': [str(uuid.uuid4()) for _ in range(rows)],
+        'Lighting_ID': [[] for _ in range(rows)],
+        'RenderedScenes_ID': [None] * rows,
+    })
+
+
+def time_load(table_name, df, copy_threshold):
+    """
+    Loads the DataFrame into a fresh table and returns the elapsed seconds.
+    """
+    df = df.rename(columns={'RenderPass_ID': f'{table_name}_ID'})  # load_to_db adds the primary key on it
+    drop_table(table_name)
+    start = time.perf_counter()
+    BaseXMLParser.load_to_db({table_name: df}, copy_threshold=copy_threshold)
+    elapsed = time.perf_counter() - start
+    drop_table(table_name)
+    return elapsed
+
+
+def drop_table(table_name):
+    with get_engine().begin() as conn:
+        conn.execute(text(f'DROP TABLE IF EXISTS "public"."{table_name}";'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare to_sql and COPY loading speed.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'to_sql rows/s':>15} {'COPY rows/s':>15} {'speedup':>8}")
+    for rows in args.rows:
+        df = make_render_pass_df(rows)
+        to_sql_time = time_load('BenchLoadToSql', df, copy_threshold=rows + 1)
+        copy_time = time_load('BenchLoadCopy', df, copy_threshold=1)
+        print(f"{rows:>10} {rows / to_sql_time:>15.0f} {rows / copy_time:>15.0f} {to_sql_time / copy_time:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark of NormalizerUtils.update_render_pass_table_with_references on a large RenderPass frame.
+The previous 'Series.apply' implementation is kept here as the reference.
+
+    python -m benchmarks.bench_render_pass_references --rows 1000000
+"""
+from XML_parser import NormalizerUtils
+
+import argparse
+import pandas as pd
+import time
+import uuid
+
+
+def make_render_pass_df(rows, distinct):
+    """
+    Creates a RenderPass frame with all shared fields, each with the given number of distinct values.
+    """
+    frame = {'Name': [f'pass_{i}' for i in range(rows)]}
+    for field in ['FeatureCodes', 'Layers', 'Lighting', 'Zones', 'Exclude', 'Include']:
+        frame[field] = [f'({field}_{i % distinct})' if i % 5 else None for i in range(rows)]
+    frame['RenderedScenes'] = [None] * rows
+    return pd.DataFrame(frame)
+
+
+def make_field_id_maps(distinct):
+    shared_fields = ['FeatureCodes', 'Layers', 'Lighting', 'Zones', 'RenderedScenes', 'Exclude', 'Include']
+    return {field: {f'({field}_{i})': str(uuid.uuid4()) for i in range(distinct)} for field in shared_fields}
+
+
+def make_normalizer(render_pass_df, field_id_maps):
+    normalizer = NormalizerUtils(render_pass_df.copy())
+    normalizer.field_id_maps = field_id_maps
+    return normalizer
+
+
+def apply_update(normalizer):
+    """
+    The previous implementation with a per-element closure and inplace drop/rename.
+    """
+    for field in normalizer.shared_fields:
+        if field in normalizer.render_pass_df.columns:
+            def map_value_or_list(value):
+                if isinstance(value, (list, tuple)):
+                    return [normalizer.field_id_maps[field].get(str(item), item) for item in value]
+                else:
+                    return normalizer.field_id_maps[field].get(str(value), value)
+
+            mapped_series = normalizer.render_pass_df[field].apply(map_value_or_list)
+            normalizer.render_pass_df[f'{field}_ID'] = mapped_series
+            normalizer.render_pass_df.drop(field, axis=1, inplace=True)
+            normalizer.render_pass_df.rename(columns={'Include_ID': 'OptionInclude_ID',
+                                                      'Exclude_ID': 'OptionExclude_ID'}, inplace=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare apply and vectorized reference mapping.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--distinct', type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'apply s':>10} {'vectorized s':>13} {'speedup':>8}")
+    for rows in args.rows:
+        render_pass_df = make_render_pass_df(rows, args.distinct)
+        field_id_maps = make_field_id_maps(args.distinct)
+
+        normalizer = make_normalizer(render_pass_df, field_id_maps)
+        start = time.perf_counter()
+        apply_update(normalizer)
+        apply_time = time.perf_counter() - start
+        expected = normalizer.render_pass_df
+
+        normalizer = make_normalizer(render_pass_df, field_id_maps)
+        start = time.perf_counter()
+        normalizer.update_render_pass_table_with_references()
+        vectorized_time = time.perf_counter() - start
+
+        assert expected.equals(normalizer.render_pass_df[expected.columns])
+        print(f"{rows:>10} {apply_time:>10.3f} {vectorized_time:>13.3f} {apply_time / vectorized_time:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
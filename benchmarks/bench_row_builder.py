@@ -0,0 +1,73 @@
+"""
+Micro-benchmark of EditorXMLParser.create_root_df on files with many 'OutputSettings'/'DeadlineSettings' records.
+The previous one-DataFrame-per-record implementation is kept here as the reference.
+
+    python -m benchmarks.bench_row_builder --records 1000 5000 20000
+"""
+from XML_parser import EditorXMLParser
+
+import xml.etree.ElementTree as ET
+import argparse
+import pandas as pd
+import time
+import uuid
+
+
+def make_editor_root(records):
+    """
+    Creates an Editor root with the given number of 'OutputSettings' and 'DeadlineSettings' records.
+    Every third record has an extra attribute, so the attribute sets are heterogeneous.
+    """
+    root = ET.Element('Editor')
+    for i in range(records):
+        output = ET.SubElement(root, 'OutputSettings', Name=f'output_{i}', Format='exr', Width='1920', Height='1080')
+        deadline = ET.SubElement(root, 'DeadlineSettings', Output=f'project_{i}', Pool='render', Priority='50')
+        if i % 3 == 0:
+            output.set('Denoise', 'true')
+            deadline.set('Comment', f'comment\n{i}')
+    return root
+
+
+def concat_root_df(root, project_id, root_name):
+    """
+    The previous implementation: one DataFrame per record, concatenated in the loop.
+    """
+    root_df = pd.DataFrame()
+    for record in root.findall(f'.//{root_name}'):
+        record_data = {attr: record.get(attr).replace('\n', '') for attr in record.attrib}
+        record_data[f'{root_name}_ID'] = uuid.uuid4()
+        record_data['Project_ID'] = project_id
+        for key, value in record_data.items():
+            if value is None:
+                record_data[key] = ''
+        current_df = pd.DataFrame([record_data])
+        root_df = pd.concat([root_df, current_df], ignore_index=True)
+    return root_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare per-record concat and RowBuilder root DataFrames.')
+    parser.add_argument('--records', type=int, nargs='+', default=[1000, 5000, 20000])
+    args = parser.parse_args()
+
+    print(f"{'records':>10} {'concat s':>10} {'builder s':>10} {'speedup':>8}")
+    for records in args.records:
+        root = make_editor_root(records)
+        xml_parser = EditorXMLParser(root, 'bench.xml')
+        project_id = uuid.uuid4()
+
+        start = time.perf_counter()
+        for root_name in ['OutputSettings', 'DeadlineSettings']:
+            concat_root_df(root, project_id, root_name)
+        concat_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for root_name in ['OutputSettings', 'DeadlineSettings']:
+            xml_parser.create_root_df(project_id, root_name)
+        builder_time = time.perf_counter() - start
+
+        print(f"{records:>10} {concat_time:>10.3f} {builder_time:>10.3f} {concat_time / builder_time:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+EXPLAIN ANALYZE timings of the join and filter queries of the pipeline with and without the declared indexes, see
+'TABLE_INDEXES' in 'XML_parser'. It runs on the tables of the database in the .env file, e.g. after
+
+    python -m benchmarks.bench_end_to_end --editors 40 --linking-records 60
+    python -m benchmarks.bench_schema_indexes --results bench_results.jsonl
+
+Each query is run with 'EXPLAIN (ANALYZE, FORMAT JSON)' as it is, and once more with index and bitmap scans disabled
+for the transaction, so both plans run on the same data. The State tables are used by the lookups of the editor files,
+the queries on them are skipped if they were already removed.
+"""
+from XML_parser import BaseXMLParser, get_engine
+from benchmarks.bench_end_to_end import git_commit
+from datetime import datetime
+from sqlalchemy import inspect, text
+
+import argparse
+import json
+import os
+import statistics
+
+RENDER_PASS_COUNTS = '''
+    SELECT bp."Project_ID",
+        count(DISTINCT bp."LinkingRecord_ID") AS num_of_linkingrecords,
+        count(DISTINCT bp."RenderPass_ID") AS num_of_basepasses,
+        count(DISTINCT op."RenderPass_ID") AS num_of_optionpasses
+    FROM "RenderPass" bp
+        LEFT JOIN "RenderPass" op ON op."BasePass_ID" = bp."RenderPass_ID"
+    WHERE bp."BasePass_ID" IS NULL {condition}
+    GROUP BY 1
+    ORDER BY 2'''
+
+LOOKUP_COLUMNS = {
+    'FeatureCodes': 'FeatureCodesNames',
+    'Layers': 'LayersNames',
+    'Lighting': 'LightingNames',
+    'Zones': 'ZonesNames',
+    'OptionExclude': 'ExcludeName',
+    'OptionInclude': 'IncludeName',
+    'RenderedScenes': 'Department',
+}
+
+
+def sample_values(conn, table_name, column_name, count):
+    """
+    Returns up to count distinct values of a column, used as the parameters of the filter queries.
+    """
+    return [value for value, in conn.execute(text(
+        f'SELECT DISTINCT "{column_name}" FROM "public"."{table_name}" WHERE "{column_name}" IS NOT NULL '
+        f'LIMIT {count};'))]
+
+
+def make_queries(conn, args):
+    """
+    Returns a dictionary of query names and (query, parameters) tuples for the tables that exist.
+    """
+    table_names = inspect(conn).get_table_names()
+    queries = {}
+    if 'RenderPass' in table_names:
+        queries['RenderPass self-join (analyse.sql)'] = (RENDER_PASS_COUNTS.format(condition=''), {})
+        project_ids = sample_values(conn, 'RenderPass', 'Project_ID', 1)
+        if project_ids:
+            queries['RenderPass self-join, one project'] = (
+                RENDER_PASS_COUNTS.format(condition='AND bp."Project_ID" = :project_id'),
+                {'project_id': project_ids[0]})
+    if 'Project' in table_names:
+        names = sample_values(conn, 'Project', 'ProjectName', 1)
+        if names:
+            queries['Project.ProjectName ='] = ('SELECT * FROM "Project" WHERE "ProjectName" = :name',
+                                                {'name': names[0]})
+    if 'State' in table_names:
+        for column_name in ['Assignments', 'Layers']:
+            values = sample_values(conn, 'State', column_name, args.in_values)
+            if values:
+                queries[f'State.{column_name} IN'] = (
+                    f'SELECT "Name", "State_ID" FROM "State" WHERE "{column_name}" IN :values',
+                    {'values': tuple(values)})
+        names = sample_values(conn, 'State', 'Name', 1)
+        if names:
+            queries['State.Name ='] = ('SELECT "State_ID" FROM "State" WHERE "Name" = :name', {'name': names[0]})
+    for table_name, column_name in LOOKUP_COLUMNS.items():
+        if table_name in table_names:
+            values = sample_values(conn, table_name, column_name, args.in_values)
+            if values:
+                queries[f'{table_name}.{column_name} IN'] = (
+                    f'SELECT "{column_name}", "{table_name}_ID" FROM "{table_name}" WHERE "{column_name}" IN :values',
+                    {'values': tuple(values)})
+    return queries
+
+
+def explain(conn, query, parameters, use_indexes):
+    """
+    Runs EXPLAIN ANALYZE in a rolled back transaction.
+    :return: A tuple of (execution time in ms, node types of the plan).
+    """
+    if not use_indexes:
+        conn.execute(text('SET LOCAL enable_indexscan = off; SET LOCAL enable_indexonlyscan = off; '
+                          'SET LOCAL enable_bitmapscan = off;'))
+    plan = conn.execute(text(f'EXPLAIN (ANALYZE, FORMAT JSON) {query}'), parameters).scalar()[0]
+    conn.rollback()
+
+    node_types = []
+    nodes = [plan['Plan']]
+    while nodes:
+        node = nodes.pop()
+        node_types.append(node['Node Type'])
+        nodes.extend(node.get('Plans', []))
+    return plan['Execution Time'], node_types
+
+
+def main():
+    parser = argparse.ArgumentParser(description='EXPLAIN ANALYZE the pipeline queries with and without indexes.')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per query and plan, the median is reported.')
+    parser.add_argument('--in-values', type=int, default=20, help='Values of the IN filters.')
+    parser.add_argument('--results', default=None, help='JSON lines file the result is appended to.')
+    args = parser.parse_args()
+
+    BaseXMLParser.bootstrap_schema()  # Creates the indexes of tables loaded before they were declared
+    results = {}
+    with get_engine().connect() as conn:
+        conn.execute(text('ANALYZE;'))
+        conn.commit()
+        for name, (query, parameters) in make_queries(conn, args).items():
+            result = {}
+            for use_indexes in [True, False]:
+                runs = [explain(conn, query, parameters, use_indexes) for _ in range(args.repeat)]
+                result['indexed' if use_indexes else 'no_index'] = {
+                    'ms': round(statistics.median(ms for ms, _ in runs), 3),
+                    'index_scan': any('Index' in node_type for node_type in runs[-1][1]),
+                }
+            results[name] = result
+
+    print(f"{'query':<40} {'indexed ms':>11} {'no index ms':>12} {'speedup':>8}  index scan")
+    for name, result in results.items():
+        indexed, no_index = result['indexed'], result['no_index']
+        speedup = no_index['ms'] / indexed['ms'] if indexed['ms'] else float('inf')
+        print(f"{name:<40} {indexed['ms']:>11.3f} {no_index['ms']:>12.3f} {speedup:>7.1f}x  {indexed['index_scan']}")
+
+    if args.results:
+        results_path = os.path.abspath(args.results)
+        with open(results_path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps({'benchmark': 'schema_indexes', 'commit': git_commit(),
+                                   'timestamp': datetime.now().isoformat(timespec='seconds'),
+                                   'parameters': vars(args), 'queries': results}) + '\n')
+        print(f"Result appended to {results_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+Generator of synthetic Editor and State XML files with the structure 'app.py' ingests.
+The files are written to '<output>/EDITORS' and '<output>/STATES', the same seed always writes the same files.
+
+    python -m benchmarks.generate_xml --output bench_data --editors 20 --linking-records 50 --base-passes 4 \
+        --option-passes 5 --feature-codes 500
+"""
+from xml.sax.saxutils import quoteattr
+
+import argparse
+import os
+import random
+
+
+def attributes(values):
+    """
+    Formats a dictionary as XML attributes, values that are None are left out.
+    """
+    return ''.join(f' {key}={quoteattr(str(value))}' for key, value in values.items() if value is not None)
+
+
+def pick_items(rng, pool, max_items, separator='\n'):
+    """
+    Picks 1 to max_items distinct items of the pool, joined by new lines like the multi-value pass attributes.
+    The 'Layers' of a State are joined by commas, which is how 'StateXMLParser' splits them.
+    """
+    return separator.join(rng.sample(pool, rng.randint(1, min(max_items, len(pool)))))
+
+
+class ValuePools:
+    """
+    The value pools of a generated data set. The pool sizes are the cardinalities of the shared fields.
+    Every state gets its layers and zone assignments here, so the 'Zones' of the passes match the states.
+    """
+
+    def __init__(self, args, rng):
+        self.feature_codes = [f'FC{i:05d}' for i in range(args.feature_codes)]
+        self.layers = [f'Layer_{i}' for i in range(args.layers)]
+        self.lighting = [f'Light_{i}' for i in range(args.lighting)]
+        self.options = [f'Option_{i}' for i in range(args.options)]
+        self.states = [f'State_{i}' for i in range(args.states)]
+        self.zones = [f'Zone_{i}' for i in range(args.zones)]
+        self.materials = [f'Material_{i}' for i in range(args.materials)]
+        self.state_layers = {state: pick_items(rng, self.layers, 3, ',') for state in self.states}
+        self.state_zones = {state: rng.sample(self.zones, rng.randint(1, min(3, len(self.zones)))) for state in
+                            self.states}
+
+
+def write_state_file(path, rng, pools, args, file_index):
+    """
+    Writes a State XML with 'ProjectSettings' and one 'StatesSettings' element holding a slice of the states.
+    """
+    states = pools.states[file_index::args.state_files]
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('<States>\n')
+        file.write(f' <ProjectSettings{attributes({"Name": f"state_project_{file_index}", "Version": "1"})}/>\n')
+        file.write(f' <StatesSettings{attributes({"Name": f"states_{file_index}"})}>\n')
+        for state_name in states:
+            file.write(f'  <State{attributes({"Name": state_name, "Layers": pools.state_layers[state_name]})}>\n')
+            for zone_name in pools.state_zones[state_name]:
+                zone = {'Name': zone_name, 'Material': rng.choice(pools.materials), 'Zone': f'{zone_name}_mesh'}
+                file.write(f'   <Zone{attributes(zone)}/>\n')
+            file.write('  </State>\n')
+        file.write(' </StatesSettings>\n')
+        file.write('</States>\n')
+
+
+def pass_attributes(rng, pools, name):
+    """
+    Creates the attributes of a 'BasePass' or 'OptionPass', every shared field is set on about half of the passes.
+    """
+    def maybe(value):
+        return value if rng.random() < 0.5 else None
+
+    return {
+        'Name': name,
+        'FeatureCodes': maybe(pick_items(rng, pools.feature_codes, 3)),
+        'Layers': maybe(pick_items(rng, pools.layers, 3)),
+        'Lighting': maybe(rng.choice(pools.lighting)),
+        'Zones': maybe('\n'.join(pools.state_zones[rng.choice(pools.states)])),
+        'Exclude': maybe(rng.choice(pools.options)),
+        'Include': maybe(rng.choice(pools.options)),
+        'State': maybe(rng.choice(pools.states)),
+        'LightingState': maybe('Day'),
+        'OverrideFilename': maybe(f'{name}.exr'),
+    }
+
+
+def write_editor_file(path, rng, pools, args, file_index):
+    """
+    Writes an Editor XML with settings elements, Jarvis data and the linking records with their passes.
+    """
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('<Editor>\n')
+        settings = {
+            'DeadlineSettings': {'Output': f'output_{file_index}', 'Pool': 'render', 'Priority': '50'},
+            'ChaosCloudSettings': {'VrScene': f'scene_{file_index}.vrscene', 'Region': 'eu'},
+            'OutputSettings': {'Name': f'output_{file_index}', 'Format': 'exr', 'Width': '1920', 'Height': '1080'},
+            'ProjectSettings': {'Name': f'editor_project_{file_index}', 'Version': '1'},
+        }
+        for tag, values in settings.items():
+            file.write(f' <{tag}{attributes(values)}/>\n')
+
+        jarvis_codes = rng.sample(pools.feature_codes, min(args.jarvis_items, len(pools.feature_codes)))
+        for category in ['Paints', 'Trims', 'Extras']:
+            file.write(f' <{category}>\n')
+            for feature_code in jarvis_codes:
+                if rng.random() < 0.5:
+                    file.write(f'  <{category[:-1]}{attributes({"FeatureCode": feature_code})}/>\n')
+            file.write(f' </{category}>\n')
+        file.write(' <Descriptions>\n')
+        for feature_code in jarvis_codes:
+            description = {'FeatureCode': feature_code, 'Description': f'Description of {feature_code}'}
+            file.write(f'  <Description{attributes(description)}/>\n')
+        file.write(' </Descriptions>\n')
+
+        for record_index in range(args.linking_records):
+            file.write(f' <linkingrecord{attributes({"Name": f"record_{record_index}"})}>\n')
+            for base_index in range(args.base_passes):
+                base_name = f'pass_{record_index}_{base_index}'
+                file.write(f'  <BasePass{attributes(pass_attributes(rng, pools, base_name))}>\n')
+                for option_index in range(args.option_passes):
+                    option = pass_attributes(rng, pools, f'{base_name}_{option_index}')
+                    file.write(f'   <OptionPass{attributes(option)}/>\n')
+                file.write('  </BasePass>\n')
+            file.write(' </linkingrecord>\n')
+        file.write('</Editor>\n')
+
+
+def generate(args):
+    """
+    Writes the State and Editor files of a data set.
+    :param args: The parsed arguments of the generator, see 'add_generator_arguments'.
+    :return: A tuple of (state paths, editor paths).
+    """
+    rng = random.Random(args.seed)
+    pools = ValuePools(args, rng)
+    state_directory = os.path.join(args.output, 'STATES')
+    editor_directory = os.path.join(args.output, 'EDITORS')
+    os.makedirs(state_directory, exist_ok=True)
+    os.makedirs(editor_directory, exist_ok=True)
+
+    state_paths = []
+    for i in range(args.state_files):
+        path = os.path.join(state_directory, f'STATES_bench_{i:04d}.xml')
+        write_state_file(path, rng, pools, args, i)
+        state_paths.append(path)
+    editor_paths = []
+    for i in range(args.editors):
+        path = os.path.join(editor_directory, f'EDITOR_bench_{i:04d}.xml')
+        write_editor_file(path, rng, pools, args, i)
+        editor_paths.append(path)
+    return state_paths, editor_paths
+
+
+def add_generator_arguments(parser):
+    """
+    Adds the scale and cardinality arguments of the generator to an argument parser.
+    """
+    parser.add_argument('--output', default='bench_data', help='Directory of the generated files.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--editors', type=int, default=10, help='Number of Editor files.')
+    parser.add_argument('--state-files', type=int, default=1, help='Number of State files.')
+    parser.add_argument('--linking-records', type=int, default=20, help='linkingrecord elements per Editor file.')
+    parser.add_argument('--base-passes', type=int, default=4, help='BasePass elements per linkingrecord.')
+    parser.add_argument('--option-passes', type=int, default=5, help='OptionPass elements per BasePass.')
+    parser.add_argument('--jarvis-items', type=int, default=100, help='Feature codes per Paints/Trims/Extras list.')
+    parser.add_argument('--feature-codes', type=int, default=500, help='Distinct feature codes.')
+    parser.add_argument('--layers', type=int, default=50, help='Distinct layers.')
+    parser.add_argument('--lighting', type=int, default=20, help='Distinct lighting values.')
+    parser.add_argument('--options', type=int, default=50, help='Distinct Exclude/Include values.')
+    parser.add_argument('--states', type=int, default=20, help='Distinct states.')
+    parser.add_argument('--zones', type=int, default=40, help='Distinct zones.')
+    parser.add_argument('--materials', type=int, default=30, help='Distinct materials.')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic Editor and State XML files.')
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+    state_paths, editor_paths = generate(args)
+    print(f'{len(state_paths)} State and {len(editor_paths)} Editor files written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from dotenv import load_dotenv
+
+import os
+import threading
+import weakref
+
+"""
+The database engine shared by 'XML_parser' and 'postgres_connect'. Importing this module doesn't read the .env file or
+connect to the database, the engine is created the first time it is used. Every process gets its own engine and
+connection pool, an engine inherited through fork is dropped in the child without closing the parent's connections.
+"""
+
+
+providers = weakref.WeakSet()
+
+
+class EngineProvider:
+    """
+    Creates the engine and the session factory of a database URL lazily, once per process.
+    """
+
+    def __init__(self, engine_url=None, dotenv_path='.env', **engine_options):
+        """
+        :param engine_url: The database URL, built from the DB_* variables of the .env file if None.
+        :param dotenv_path: The .env file, resolved against the working directory at construction.
+        :param engine_options: Arguments of 'create_engine', e.g. the pool size.
+        """
+        self.engine_url = engine_url
+        self.dotenv_path = os.path.abspath(dotenv_path)
+        self.engine_options = engine_options
+        self._engine = None
+        self._session_factory = None
+        self._pid = None
+        self._lock = threading.Lock()
+        providers.add(self)
+
+    def get_engine_url(self):
+        """
+        Returns the database URL, loading the environment variables of the .env file if no URL was given.
+        """
+        if self.engine_url is not None:
+            return self.engine_url
+        load_dotenv(override=True, dotenv_path=self.dotenv_path)
+        return (f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PWD')}@{os.getenv('DB_HOST')}:"
+                f"{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}")
+
+    def get_engine(self):
+        """
+        Returns the engine of the current process, creating it on the first call in the process.
+        """
+        if self._engine is None or self._pid != os.getpid():
+            with self._lock:
+                if self._engine is None or self._pid != os.getpid():
+                    self._drop_inherited_engine()
+                    self._engine = create_engine(self.get_engine_url(), **self.engine_options)
+                    self._session_factory = sessionmaker(bind=self._engine)
+                    self._pid = os.getpid()
+        return self._engine
+
+    def get_session_factory(self):
+        """
+        Returns the sessionmaker bound to the engine of the current process.
+        """
+        self.get_engine()
+        return self._session_factory
+
+    def get_session(self):
+        return self.get_session_factory()()
+
+    def dispose(self):
+        """
+        Closes the pooled connections of the current process, the next use creates a new engine.
+        """
+        with self._lock:
+            if self._engine is not None and self._pid == os.getpid():
+                self._engine.dispose()
+            self._engine = None
+            self._session_factory = None
+
+    def _drop_inherited_engine(self):
+        if self._engine is not None and self._pid != os.getpid():
+            self._engine.dispose(close=False)  # The connections belong to the parent process
+            self._engine = None
+            self._session_factory = None
+
+    def _after_fork_in_child(self):
+        self._lock = threading.Lock()  # The lock may have been held by another thread of the parent
+        self._drop_inherited_engine()
+
+
+def after_fork_in_child():
+    for provider in list(providers):
+        provider._after_fork_in_child()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=after_fork_in_child)
+
+engine_provider = EngineProvider(pool_size=10, max_overflow=20, pool_timeout=30)
+
+
+def get_engine():
+    """
+    Returns the shared engine of the current process.
+    """
+    return engine_provider.get_engine()
+
+
+def get_session():
+    """
+    Returns a new session of the shared engine.
+    """
+    return engine_provider.get_session()
@@ -0,0 +1,201 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import functools
+import json
+import threading
+import time
+
+"""
+Instrumentation of the ingestion pipeline. Stages are wrapped in named spans which record their duration, row count,
+bytes read and database round trips, with labels like the file or the table. Spans are not recorded until 'enable' is
+called, a disabled span is a shared no-op object.
+"""
+
+
+class Span:
+    """
+    A recorded span. Row and byte counts are set by the instrumented code with 'set'.
+    """
+
+    def __init__(self, name, labels, round_trips):
+        self.name = name
+        self.labels = labels
+        self.rows = None
+        self.bytes = None
+        self.start_round_trips = round_trips
+        self.start = time.perf_counter()
+
+    def set(self, rows=None, bytes=None):
+        if rows is not None:
+            self.rows = rows
+        if bytes is not None:
+            self.bytes = bytes
+
+
+class NullSpan:
+    """
+    The span of a disabled metrics object, it is its own context manager so a disabled span costs one call.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set(self, rows=None, bytes=None):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class PipelineMetrics:
+    """
+    Collects the spans of a run. The labels of a span are inherited by the spans opened inside it in the same
+    thread, e.g. a 'load' span inside a 'file' span gets the file label.
+
+    Round trips are the statements executed through SQLAlchemy engines, counted per thread with an engine event, plus
+    the raw COPY statements reported with 'add_round_trips'.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.records = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._listening = False
+
+    def enable(self):
+        """
+        Starts recording spans and counting round trips.
+        """
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._count_statement)
+            self._listening = True
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def _count_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.add_round_trips(1)
+
+    def add_round_trips(self, count):
+        if self.enabled:
+            self._local.round_trips = getattr(self._local, 'round_trips', 0) + count
+
+    def _labels(self):
+        if not hasattr(self._local, 'labels'):
+            self._local.labels = [{}]
+        return self._local.labels
+
+    @contextmanager
+    def _record(self, name, labels):
+        label_stack = self._labels()
+        labels = dict(label_stack[-1], **labels)
+        span = Span(name, labels, getattr(self._local, 'round_trips', 0))
+        label_stack.append(labels)
+        try:
+            yield span
+        finally:
+            label_stack.pop()
+            record = {'span': name, **labels, 'seconds': round(time.perf_counter() - span.start, 6),
+                      'rows': span.rows, 'bytes': span.bytes,
+                      'round_trips': getattr(self._local, 'round_trips', 0) - span.start_round_trips}
+            with self._lock:
+                self.records.append(record)
+
+    def span(self, name, **labels):
+        """
+        Returns a context manager that records a span, e.g.
+
+            with metrics.span('load', table=table_name) as span:
+                span.set(rows=len(df))
+
+        :param name: The name of the stage.
+        :param labels: Labels of the span, None values are left out.
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return self._record(name, {key: str(value) for key, value in labels.items() if value is not None})
+
+    def timed(self, name):
+        """
+        Decorator that records a span for every call of the function, labeled with the function name.
+        :param name: The name of the stage.
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with self.span(name, helper=function.__name__):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def drain(self):
+        """
+        Removes and returns the recorded spans, e.g. to send them from a worker process to the main process.
+        """
+        with self._lock:
+            records, self.records = self.records, []
+        return records
+
+    def merge(self, records):
+        """
+        Adds spans recorded by another process.
+        """
+        with self._lock:
+            self.records.extend(records)
+
+    def write_json_lines(self, path):
+        """
+        Writes one JSON object per span.
+        """
+        with open(path, 'w', encoding='utf-8') as file:
+            for record in self.records:
+                file.write(json.dumps(record) + '\n')
+
+    def write_prometheus(self, path):
+        """
+        Writes the spans aggregated by name and labels in the Prometheus text format, e.g. for the node exporter's
+        textfile collector.
+        """
+        totals = {}
+        for record in self.records:
+            labels = tuple((key, value) for key, value in record.items() if
+                           key not in ['seconds', 'rows', 'bytes', 'round_trips'])
+            total = totals.setdefault(labels, {'count': 0, 'seconds': 0.0, 'rows': 0, 'bytes': 0, 'round_trips': 0})
+            total['count'] += 1
+            for key in ['seconds', 'rows', 'bytes', 'round_trips']:
+                total[key] += record[key] or 0
+
+        metric_names = {'count': 'xml_pipeline_spans_total', 'seconds': 'xml_pipeline_span_seconds_total',
+                        'rows': 'xml_pipeline_rows_total', 'bytes': 'xml_pipeline_bytes_read_total',
+                        'round_trips': 'xml_pipeline_db_round_trips_total'}
+        with open(path, 'w', encoding='utf-8') as file:
+            for key, metric_name in metric_names.items():
+                file.write(f'# TYPE {metric_name} counter\n')
+                for labels, total in totals.items():
+                    label_text = ','.join(f'{label}="{self.escape_label(value)}"' for label, value in labels)
+                    file.write(f'{metric_name}{{{label_text}}} {total[key]}\n')
+
+    @staticmethod
+    def escape_label(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+    def write(self, path, output_format='jsonl'):
+        """
+        Writes the spans as JSON lines ('jsonl') or in the Prometheus text format ('prometheus').
+        """
+        if output_format == 'prometheus':
+            self.write_prometheus(path)
+        else:
+            self.write_json_lines(path)
+
+
+metrics = PipelineMetrics()
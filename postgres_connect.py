@@ -1,26 +1,18 @@
 from sqlalchemy import *
 from sqlalchemy.ext.automap import automap_base
-from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
+from database import EngineProvider, engine_provider
+from collections import OrderedDict
 
-import os
+import pandas as pd
+import threading
+import time
+import traceback
+import uuid
 
-''' 
-load env variables from .env file to use in the code 
-'''
-load_dotenv(override=True, dotenv_path='.env')
-
-''' get env variables to connect to the database '''
-DB_HOST = os.getenv('DB_HOST')
-DB_NAME = os.getenv('DB_NAME')
-DB_USER = os.getenv('DB_USER')
-DB_PWD = os.getenv('DB_PWD')
-DB_PORT = os.getenv('DB_PORT')
-
-''' 
-create the engine url to connect to the database
-'''
-engine_url = f'postgresql://{DB_USER}:{DB_PWD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+''' number of rows fetched from a server-side cursor per round trip by the streaming read methods '''
+STREAM_BATCH_SIZE = 10000
+''' number of rows or keys written per transaction by the bulk insert and delete methods '''
+BULK_CHUNK_SIZE = 1000
 
 
 class ToDictMixin:
@@ -31,11 +23,155 @@ class ToDictMixin:
         return {c.key: getattr(self, c.key) for c in self.__table__.columns}
 
 
+class QueryResultCache:
+    """
+    An LRU cache of query results with a time to live, keyed by table name and filter arguments.
+    The least recently used result is evicted when max_size results are cached, and a result older than ttl seconds
+    is read again. The results of a table are removed with 'invalidate_table' when the table is written, a result
+    read before that is not cached when it arrives afterwards.
+    """
+
+    def __init__(self, max_size=128, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._results = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(table_name, filters):
+        """
+        Returns the cache key of a query, or None if a filter value is not hashable.
+        """
+        key = (table_name, tuple(sorted(filters.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def get(self, key):
+        """
+        Returns a copy of the cached rows of a key, or None on a miss.
+        """
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._results[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._results.move_to_end(key)
+            self.hits += 1
+            return [dict(row) for row in entry[1]]
+
+    def generation(self, table_name):
+        """
+        Returns the number of times a table was invalidated, it is passed to 'put' with the rows read after it.
+        """
+        with self._lock:
+            return self._generations.get(table_name, 0)
+
+    def put(self, key, rows, generation):
+        with self._lock:
+            if self._generations.get(key[0], 0) != generation:
+                return  # The table was written while the rows were read
+            self._results[key] = (time.monotonic(), [dict(row) for row in rows])
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_table(self, table_name):
+        with self._lock:
+            self._generations[table_name] = self._generations.get(table_name, 0) + 1
+            for key in [key for key in self._results if key[0] == table_name]:
+                del self._results[key]
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def stats(self):
+        """
+        Returns the hit, miss and eviction counters and the number of cached results.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'size': len(self._results)}
+
+
 class PostgresConnect:
-    def __init__(self, engine_url=engine_url):
-        self.sql_engine = create_engine(engine_url, pool_size=10, max_overflow=20, pool_timeout=30)
-        self.Base = self.initialize_base()
-        self.Session = sessionmaker(bind=self.sql_engine)
+    def __init__(self, engine_url=None, cache_size=None, cache_ttl=None, lazy_reflection=False):
+        """
+        :param engine_url: The database URL. If None, the engine shared with 'XML_parser' is used, it is created from
+            the .env file on first use. Either way the engine is created once per process, see 'database'.
+        :param cache_size: If set, the results of 'get_selected_table' and 'get_filtered_data_from_selected_table'
+            are cached, at most cache_size of them. The cache of a table is cleared when it is written through this
+            object, writes from other connections are only seen after cache_ttl seconds.
+        :param cache_ttl: The seconds a cached result is used, without limit if None.
+        :param lazy_reflection: If True, a table is reflected and mapped the first time it is used instead of
+            reflecting the whole schema here.
+        """
+        if engine_url is None:
+            self.engine_provider = engine_provider
+        else:
+            self.engine_provider = EngineProvider(engine_url, pool_size=10, max_overflow=20, pool_timeout=30)
+        self.lazy_reflection = lazy_reflection
+        self.reflection_lock = threading.Lock()
+        self.Base = automap_base(cls=ToDictMixin) if lazy_reflection else self.initialize_base()
+        self.query_cache = QueryResultCache(cache_size, cache_ttl) if cache_size else None
+
+    '''
+    The engine and the session factory of the current process
+    '''
+
+    @property
+    def sql_engine(self):
+        return self.engine_provider.get_engine()
+
+    @property
+    def Session(self):
+        return self.engine_provider.get_session_factory()
+
+    '''
+    Get the hit, miss and eviction counters of the query result cache, None if the cache is not enabled
+    '''
+
+    def cache_stats(self):
+        return self.query_cache.stats() if self.query_cache is not None else None
+
+    '''
+    Remove the cached results of a table, or of all tables if table_name is None
+    '''
+
+    def invalidate_cache(self, table_name=None):
+        if self.query_cache is not None:
+            if table_name is None:
+                self.query_cache.clear()
+            else:
+                self.query_cache.invalidate_table(table_name)
+
+    '''
+    Get rows from the query result cache, or run the query and cache its rows
+    param: query: a function returning the rows as a list of dictionaries, or None if the query failed
+    '''
+
+    def cached_query(self, table_name, filters, query):
+        key = self.query_cache.make_key(table_name, filters) if self.query_cache is not None else None
+        if key is None:
+            return query()
+        rows = self.query_cache.get(key)
+        if rows is None:
+            generation = self.query_cache.generation(table_name)
+            rows = query()
+            if rows is not None:
+                self.query_cache.put(key, rows, generation)
+        return rows
 
     ''' 
     initialize the base object to use in the code 
@@ -55,12 +191,45 @@ class PostgresConnect:
         for class_ in Base.classes:
             class_.__bases__ = (ToDictMixin,) + class_.__bases__
 
+    '''
+    Reflect and map one table in lazy reflection mode, the mapped classes of the lazy Base get ToDictMixin as their
+    base class, so apply_mixin is not needed
+    param: table_name: the name of the table to reflect
+    '''
+
+    def reflect_table(self, table_name):
+        with self.reflection_lock:
+            if f'public.{table_name}' not in self.Base.metadata.tables:
+                self.Base.prepare(autoload_with=self.sql_engine, schema='public',
+                                  reflection_options={'only': [table_name]})
+
+    '''
+    Get the mapped class of the selected table, it is reflected first in lazy reflection mode
+    '''
+
+    def get_class(self, table_name):
+        if self.lazy_reflection:
+            self.reflect_table(table_name)
+        return getattr(self.Base.classes, table_name)
+
+    '''
+    Get the Table object of the selected table, it is reflected first in lazy reflection mode
+    '''
+
+    def get_table(self, table_name):
+        if self.lazy_reflection:
+            self.reflect_table(table_name)
+        return self.Base.metadata.tables[f'public.{table_name}']
+
     '''
     Print existing tables from the database
     '''
 
     def print_exist_tables(self):
-        print(self.Base.classes.keys())
+        if self.lazy_reflection:
+            print(inspect(self.sql_engine).get_table_names(schema='public'))
+        else:
+            print(self.Base.classes.keys())
 
     '''
     Get selected table from the database as dict in a list
@@ -70,9 +239,12 @@ class PostgresConnect:
     '''
 
     def get_selected_table(self, table_name):
+        return self.cached_query(table_name, {}, lambda: self.query_selected_table(table_name))
+
+    def query_selected_table(self, table_name):
         try:
             session = self.Session()
-            table = getattr(self.Base.classes, table_name)
+            table = self.get_class(table_name)
             results = session.query(table).all()
             return [result.to_dict() for result in results]
         except Exception as e:
@@ -87,10 +259,15 @@ class PostgresConnect:
     '''
 
     def get_filtered_data_from_selected_table(self, **kwargs):
+        filters = {key: value for key, value in kwargs.items() if key != 'table_name'}
+        return self.cached_query(kwargs.get('table_name'), filters,
+                                 lambda: self.query_filtered_data_from_selected_table(**kwargs))
+
+    def query_filtered_data_from_selected_table(self, **kwargs):
         try:
             session = self.Session()
             table_name = kwargs.pop('table_name')
-            table = getattr(self.Base.classes, table_name)
+            table = self.get_class(table_name)
             results = session.query(table).filter_by(**kwargs).all()
             return [result.to_dict() for result in results]
         except Exception as e:
@@ -98,6 +275,79 @@ class PostgresConnect:
         finally:
             session.close()
 
+    '''
+    Build a SELECT of the given columns of the selected table, filtered by column=value pairs like filter_by
+    param: table_name: the name of the table to query
+    param: columns: the names of the columns to select, all columns if None
+    param: filters: the column=value pairs to filter by
+    return: a tuple of the select statement and the names of the selected columns
+    '''
+
+    def build_select(self, table_name, columns=None, **filters):
+        table = self.get_table(table_name)
+        selected_columns = [table.c[column] for column in columns] if columns else list(table.c)
+        statement = select(*selected_columns)
+        for column, value in filters.items():
+            statement = statement.where(table.c[column] == value)
+        return statement, [column.name for column in selected_columns]
+
+    '''
+    Stream the rows of the selected table in batches with a server-side cursor, no ORM objects are created
+    param: table_name: the name of the table to query
+    param: columns: the names of the columns to read, all columns if None
+    param: batch_size: the number of rows fetched per round trip and yielded per batch
+    param: filters: the column=value pairs to filter by
+    return: an iterator of row batches, each batch is a list of row tuples in the order of the columns
+    An unknown table or column is printed and nothing is yielded. Errors while reading, e.g. a dropped connection,
+    are raised to the caller, so a stream is never cut short silently.
+    '''
+
+    def stream_selected_table(self, table_name, columns=None, batch_size=STREAM_BATCH_SIZE, **filters):
+        try:
+            statement, _ = self.build_select(table_name, columns, **filters)
+        except Exception as e:
+            print(f"Exception occurred while streaming the table for {table_name}: {e}")
+            return
+        with self.sql_engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(statement)
+            for partition in result.partitions():
+                yield [tuple(row) for row in partition]
+
+    '''
+    Stream the rows of the selected table as pandas DataFrames of at most batch_size rows
+    return: an iterator of DataFrames with the selected columns
+    '''
+
+    def stream_selected_table_as_dataframes(self, table_name, columns=None, batch_size=STREAM_BATCH_SIZE, **filters):
+        try:
+            _, column_names = self.build_select(table_name, columns)
+        except Exception as e:
+            print(f"Exception occurred while streaming the table for {table_name}: {e}")
+            return
+        for batch in self.stream_selected_table(table_name, columns, batch_size, **filters):
+            yield pd.DataFrame.from_records(batch, columns=column_names)
+
+    '''
+    Get the selected columns of a table, read in batches with a server-side cursor
+    param: as_numpy: if True, a dictionary of column names and NumPy arrays is returned instead of a DataFrame
+    return: a DataFrame, or a dictionary of NumPy arrays, with the selected columns
+    '''
+
+    def get_selected_columns(self, table_name, columns=None, batch_size=STREAM_BATCH_SIZE, as_numpy=False, **filters):
+        try:
+            _, column_names = self.build_select(table_name, columns)
+        except Exception as e:
+            print(f"Exception occurred while getting the columns for {table_name}: {e}")
+            return None
+        values = {column: [] for column in column_names}
+        for batch in self.stream_selected_table(table_name, columns, batch_size, **filters):
+            for column, column_values in zip(column_names, zip(*batch)):
+                values[column].extend(column_values)
+        df = pd.DataFrame(values, columns=column_names)
+        if as_numpy:
+            return {column: df[column].to_numpy() for column in column_names}
+        return df
+
     '''
     Insert data into a table that is selected from the database    
     '''
@@ -106,10 +356,11 @@ class PostgresConnect:
         try:
             session = self.Session()
             table_name = kwargs.pop('table_name')
-            table = getattr(self.Base.classes, table_name)
+            table = self.get_class(table_name)
             new_row = table(**kwargs)
             session.add(new_row)
             session.commit()
+            self.invalidate_cache(table_name)
             print(f"Data inserted successfully into {table_name}. With data: {kwargs}")
         except Exception as e:
             print(f"Exception occurred while inserting data to the table for {table_name}: {e}")
@@ -124,9 +375,10 @@ class PostgresConnect:
         try:
             session = self.Session()
             table_name = kwargs.pop('table_name')
-            table = getattr(self.Base.classes, table_name)
+            table = self.get_class(table_name)
             session.query(table).filter_by(**kwargs).delete()
             session.commit()
+            self.invalidate_cache(table_name)
             print(f"Data deleted successfully from the table for {table_name}. With data: {kwargs}")
         except Exception as e:
             print(f"Exception occurred while deleting data from the table for {table_name}: {e}")
@@ -134,6 +386,70 @@ class PostgresConnect:
         finally:
             session.close()
 
+    '''
+    Print the row count, duration and throughput of a bulk operation batch
+    '''
+
+    @staticmethod
+    def report_batch(operation, table_name, batch_number, row_count, seconds):
+        rows_per_second = row_count / seconds if seconds else float('inf')
+        print(f"{operation} batch {batch_number} of {table_name}: {row_count} rows in {seconds:.3f}s "
+              f"({rows_per_second:.0f} rows/s)")
+
+    '''
+    Insert a list of rows into the selected table, every chunk of rows is inserted with one executemany in its own
+    transaction. If a chunk fails, it is rolled back and the remaining chunks are not inserted.
+    param: table_name: the name of the table to insert into
+    param: rows: a list of dictionaries of column names and values
+    param: chunk_size: the number of rows per transaction
+    return: the number of inserted rows
+    '''
+
+    def bulk_insert_to_selected_table(self, table_name, rows, chunk_size=BULK_CHUNK_SIZE):
+        inserted_count = 0
+        try:
+            table = self.get_table(table_name)
+            for batch_number, start in enumerate(range(0, len(rows), chunk_size), start=1):
+                chunk = rows[start:start + chunk_size]
+                start_time = time.perf_counter()
+                with self.sql_engine.begin() as conn:
+                    conn.execute(insert(table), chunk)
+                self.invalidate_cache(table_name)
+                self.report_batch('Insert', table_name, batch_number, len(chunk), time.perf_counter() - start_time)
+                inserted_count += len(chunk)
+        except Exception as e:
+            print(f"Exception occurred while inserting data to the table for {table_name}: {e}")
+        return inserted_count
+
+    '''
+    Delete the rows of the selected table whose key column is in a list of keys, with one
+    DELETE ... WHERE key = ANY(:keys) per chunk of keys in its own transaction.
+    If a chunk fails, it is rolled back and the remaining chunks are not deleted.
+    param: table_name: the name of the table to delete from
+    param: key_column: the name of the column the keys are compared with, e.g. 'Project_ID'
+    param: keys: a list of key values
+    param: chunk_size: the number of keys per transaction
+    return: the number of deleted rows
+    '''
+
+    def bulk_delete_from_selected_table(self, table_name, key_column, keys, chunk_size=BULK_CHUNK_SIZE):
+        deleted_count = 0
+        try:
+            table = self.get_table(table_name)
+            column = table.c[key_column]
+            statement = delete(table).where(column == any_(bindparam('keys', type_=ARRAY(column.type))))
+            for batch_number, start in enumerate(range(0, len(keys), chunk_size), start=1):
+                chunk = list(keys[start:start + chunk_size])
+                start_time = time.perf_counter()
+                with self.sql_engine.begin() as conn:
+                    row_count = conn.execute(statement, {'keys': chunk}).rowcount
+                self.invalidate_cache(table_name)
+                self.report_batch('Delete', table_name, batch_number, row_count, time.perf_counter() - start_time)
+                deleted_count += row_count
+        except Exception as e:
+            print(f"Exception occurred while deleting data from the table for {table_name}: {e}")
+        return deleted_count
+
 
 if __name__ == '__main__':
     ''' 
@@ -146,18 +462,28 @@ if __name__ == '__main__':
     '''
 
     print(postgres_connect.get_selected_table('Project'))
-    postgres_connect.insert_data_to_selected_table(table_name='Project', Project_ID='python_test_project',
+    postgres_connect.insert_data_to_selected_table(table_name='Project',
+                                                   Project_ID='4f8a6a1e-5b0c-4c2e-9f3e-2d7c1b6a9e10',
                                                    ProjectName='python_test_name')
 
     '''
     We don't delete this data for testing purposes. However, we need to delete it after testing to get back to the initial state.
     '''
-    postgres_connect.insert_data_to_selected_table(table_name='Project', Project_ID='python_test_project_2',
+    postgres_connect.insert_data_to_selected_table(table_name='Project',
+                                                   Project_ID='9b2d7c3e-1f4a-4e8b-a6d5-0c3f2e1b7a94',
                                                    ProjectName='python_test_name_2')
-    postgres_connect.delete_data_from_selected_table(table_name='Project', Project_ID='python_test_project',
+    postgres_connect.delete_data_from_selected_table(table_name='Project',
+                                                     Project_ID='4f8a6a1e-5b0c-4c2e-9f3e-2d7c1b6a9e10',
                                                      ProjectName='python_test_name')
     print(postgres_connect.get_selected_table('Project'))
     print(postgres_connect.get_filtered_data_from_selected_table(table_name='Project',
-                                                                 Project_ID='python_test_project_2'))
+                                                                 Project_ID='9b2d7c3e-1f4a-4e8b-a6d5-0c3f2e1b7a94'))
     print(
         postgres_connect.get_filtered_data_from_selected_table(table_name='Project', ProjectName='python_test_name_2'))
+
+    '''
+    Insert and delete many rows with the bulk methods
+    '''
+    bulk_rows = [{'Project_ID': str(uuid.uuid4()), 'ProjectName': f'python_bulk_test_{i}'} for i in range(5000)]
+    postgres_connect.bulk_insert_to_selected_table('Project', bulk_rows)
+    postgres_connect.bulk_delete_from_selected_table('Project', 'Project_ID', [row['Project_ID'] for row in bulk_rows])